@@ -0,0 +1,155 @@
+#!/usr/bin/python
+"""Per message cost of turning an MQTT set message into queued changes, under a flood of set messages.
+
+Run from the repository root: python benchmarks/bench_dispatch.py
+"Before" is the split and if/elif chain of _on_mqtt_message, kept here for comparison. "After" is the
+command registry and precompiled topic pattern, which also logs one debug line per message instead of
+two, their f-strings are formatted even with debug logging off. The flood is spread over a 100 device
+fleet and a fifth of the messages are invalid: an unknown device, command or value. Queueing itself is
+left out, both sides only record what they would queue.
+"""
+import logging
+import os
+import random
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from broadlink_ac_mqtt.ac_communication.broadlink.ac_db import ac_db  # noqa: E402
+from broadlink_ac_mqtt.ac_communication.broadlink.ac_status import AcStatus  # noqa: E402
+from broadlink_ac_mqtt.ac_to_mqtt_adapter import AcToMqtt  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+FLEET = 100
+MESSAGES = 10000
+PREFIX = "/aircon/"
+
+VALID = [
+    ("temp", "21.5"), ("temp", "30"), ("power", "ON"), ("power", "off"), ("mode", "COOLING"),
+    ("mode", "HEATING"), ("fanspeed", "LOW"), ("fanspeed", "turbo"), ("fanspeed_homeassistant", "Mute"),
+    ("mode_homekit", "CoolOn"), ("mode_homeassistant", "fan_only"), ("fixation_v", "TOP"),
+    ("fixation_h", "LEFT"), ("display", "ON"), ("sleep", "OFF"), ("state", "refresh"),
+]
+INVALID = [("temp", "warm"), ("temp", "nan"), ("power", "maybe"), ("mode", "party"), ("bogus", "1")]
+
+
+def legacy_dispatch(adapter, msg):
+    try:
+        logger.debug(f'Mqtt Message Received! Userdata: {None}, Message {msg.topic + " " + str(msg.payload)}')
+        function = str(msg.topic.split('/')[-2])
+        address = msg.topic.split('/')[-3]
+        address = address.encode('ascii', 'ignore').decode("utf-8")
+        value = str(msg.payload.decode("ascii"))
+        logger.debug(f'Mqtt decoded --> Function: {function}, Address: {address}, value: {value}')
+    except Exception:
+        return
+
+    device = adapter.device_objects.get(address) if adapter.device_objects else None
+    if not device:
+        logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
+        return
+
+    try:
+        if function == "temp":
+            changes = device.temperature_changes(float(value))
+        elif function == "power":
+            changes = device.power_changes(value)
+        elif function == "mode":
+            changes = device.mode_changes(value)
+        elif function == "fanspeed" or function == "fanspeed_homeassistant":
+            if value.lower() == "turbo":
+                changes = device.turbo_changes("ON")
+            elif value.lower() == "mute":
+                changes = device.mute_changes("ON")
+            else:
+                changes = device.fanspeed_changes(value)
+        elif function == "mode_homekit":
+            changes = device.homekit_mode_changes(value)
+        elif function == "mode_homeassistant":
+            changes = device.homeassistant_mode_changes(value)
+        elif function == "state":
+            if value == "refresh":
+                adapter.submit_refresh(address, device)
+            return
+        elif function == "fixation_v":
+            changes = device.fixation_v_changes(value)
+        elif function == "fixation_h":
+            changes = device.fixation_h_changes(value)
+        elif function in ("display", "mildew", "clean", "health", "sleep"):
+            changes = device.onoff_changes(function, value)
+        else:
+            return
+    except Exception:
+        return
+
+    if changes is None:
+        return
+    adapter.submit_changes(address, device, changes)
+
+
+class RecordingAdapter(AcToMqtt):
+    def __init__(self, devices):
+        super().__init__({'mqtt_topic_prefix': PREFIX})
+        self.device_objects = devices
+        self.queued = []
+
+    def submit_changes(self, address, device, changes):
+        self.queued.append((address, changes))
+
+    def submit_refresh(self, address, device):
+        self.queued.append((address, None))
+
+
+def make_device(index):
+    # An ac_db without the network part of __init__
+    device = ac_db.__new__(ac_db)
+    device.status = AcStatus()
+    device._nice_status = None
+    device._nice_version = None
+    device.set_default_values()
+    device.status['macaddress'] = format(index, '012x')
+    return device
+
+
+def flood(rng):
+    messages = []
+    for _ in range(MESSAGES):
+        address = format(rng.randrange(FLEET + 5), '012x')
+        function, value = rng.choice(VALID) if rng.random() < 0.8 else rng.choice(INVALID)
+        messages.append(SimpleNamespace(topic=f"{PREFIX}{address}/{function}/set", payload=value.encode()))
+    return messages
+
+
+def main():
+    devices = {device.status['macaddress']: device for device in map(make_device, range(FLEET))}
+    messages = flood(random.Random(1))
+    before_adapter = RecordingAdapter(devices)
+    after_adapter = RecordingAdapter(devices)
+
+    def before():
+        for msg in messages:
+            legacy_dispatch(before_adapter, msg)
+
+    def after():
+        for msg in messages:
+            after_adapter._on_mqtt_message(None, None, msg)
+
+    before()
+    after()
+    assert [(address, changes) for address, changes in before_adapter.queued
+            if changes is None or 'temp' not in changes] == \
+           [(address, changes) for address, changes in after_adapter.queued
+            if changes is None or 'temp' not in changes]
+    print(f"{len(after_adapter.queued)} of {MESSAGES} messages queued, {len(before_adapter.queued)} before "
+          f"(a NaN temperature is no longer queued)")
+
+    for name, func in (("before", before), ("after", after)):
+        seconds = min(timeit.repeat(func, number=5, repeat=5)) / 5 / MESSAGES
+        print(f"{name:<8} {seconds * 1e6:>8.2f} us/message {1 / seconds:>12,.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+"""Frames per second of the frame codec compared to the byte-by-byte implementation it replaced.
+
+Run from the repository root: python benchmarks/bench_frame_codec.py
+Encryption is left out (identity function) so only framing cost is measured. Only encoding is compared,
+reading the error code and payload of a reply was already cheap. That both encoders give the same frames
+is checked by tests/test_frame_codec.py.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from broadlink_ac_mqtt.ac_communication.broadlink.frame_codec import FrameCodec  # noqa: E402
+from tests.reference import legacy_encode_frame  # noqa: E402
+
+MAC = bytearray.fromhex('b4222dce73f1')
+SESSION_ID = bytearray(b'\x01\x02\x03\x04')
+PAYLOAD = bytearray(os.urandom(32))
+
+
+def no_encrypt(payload):
+    return bytes(payload)
+
+
+def report(name, seconds, number):
+    print(f"{name:<16} {number / seconds:>12,.0f} frames/s")
+
+
+def main(number=100000):
+    codec = FrameCodec(MAC)
+
+    report("encode before", timeit.timeit(
+        lambda: legacy_encode_frame(MAC, 0x6a, 1234, SESSION_ID, PAYLOAD, no_encrypt), number=number), number)
+    report("encode after", timeit.timeit(
+        lambda: codec.encode(0x6a, 1234, SESSION_ID, PAYLOAD, no_encrypt), number=number), number)
+
+
+if __name__ == "__main__":
+    main()
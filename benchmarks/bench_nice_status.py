@@ -0,0 +1,87 @@
+#!/usr/bin/python
+"""Per call cost and allocations of make_nice_status for a 100 device fleet.
+
+Run from the repository root: python benchmarks/bench_nice_status.py
+"Before" is the get_key based implementation with a plain status dict, kept here for comparison.
+"Polled" is the usual case where a poll returns the same state as the previous one, "changed" has
+every device report a different state on every call. That the output matches the old implementation is
+checked by tests/test_nice_status.py.
+"""
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from broadlink_ac_mqtt.ac_communication.broadlink.ac_db import ac_db  # noqa: E402
+from broadlink_ac_mqtt.ac_communication.broadlink.ac_status import AcStatus  # noqa: E402
+from broadlink_ac_mqtt.ac_communication.broadlink.state_codec import AC_STATE_CODEC  # noqa: E402
+from tests.reference import legacy_make_nice_status, random_values  # noqa: E402
+
+FLEET = 100
+
+
+def make_device(index, values):
+    # An ac_db without the network part of __init__
+    device = ac_db.__new__(ac_db)
+    device.status = AcStatus()
+    device._nice_status = None
+    device._nice_version = None
+    device.set_default_values()
+    for key, value in values.items():
+        device.status[key] = value
+    device.status['macaddress'] = format(index, '012x')
+    return device
+
+
+def decoded(values):
+    return tuple(values[name] for name in AC_STATE_CODEC.names)
+
+
+def measure(name, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number / FLEET
+    # Results are kept, as the adapter keeps the last published status of every device
+    tracemalloc.start()
+    results = func()  # noqa: F841
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<16} {seconds * 1e6:>8.2f} us/call {peak / FLEET:>10,.0f} bytes/call")
+
+
+def main():
+    rng = random.Random(1)
+    fleet_values = [random_values(rng) for _ in range(FLEET)]
+    other_values = [random_values(rng) for _ in range(FLEET)]
+    devices = [make_device(index, values) for index, values in enumerate(fleet_values)]
+    legacy_statuses = [{key: device.status[key] for key in device.status} for device in devices]
+
+    states = [(decoded(a), decoded(b)) for a, b in zip(fleet_values, other_values)]
+    flip = [0]
+
+    def before():
+        return [legacy_make_nice_status(status) for status in legacy_statuses]
+
+    def polled():
+        results = []
+        for device, (state, _) in zip(devices, states):
+            device.status.update_decoded(AC_STATE_CODEC.names, state)
+            results.append(device.make_nice_status(device.status))
+        return results
+
+    def changed():
+        flip[0] ^= 1
+        results = []
+        for device, state in zip(devices, states):
+            device.status.update_decoded(AC_STATE_CODEC.names, state[flip[0]])
+            results.append(device.make_nice_status(device.status))
+        return results
+
+    measure("before", before, 200)
+    measure("after (polled)", polled, 200)
+    measure("after (changed)", changed, 200)
+
+
+if __name__ == "__main__":
+    main()
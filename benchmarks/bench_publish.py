@@ -0,0 +1,122 @@
+#!/usr/bin/python
+"""Publish path cost per field for a 100 device fleet polled at 1 Hz.
+
+Run from the repository root: python benchmarks/bench_publish.py
+Every round publishes the full status of every device, as a heartbeat does, from publish_mqtt_info through
+the publish queue into paho up to the point where the packet would be written to the socket. "Before"
+builds every topic by concatenation and leaves encoding the value to paho, as publish_mqtt_info did.
+"After" uses the per-device topic table and the payload cache, and hands the fields of a status to the
+client in one batch. "Paho" is client.publish alone with ready made topics, the floor of any topic per
+value layout.
+"""
+import os
+import random
+import sys
+import timeit
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from broadlink_ac_mqtt.ac_communication.broadlink.ac_db import ac_db  # noqa: E402
+from broadlink_ac_mqtt.ac_communication.broadlink.ac_status import AcStatus  # noqa: E402
+from broadlink_ac_mqtt.ac_to_mqtt_adapter import AcToMqtt  # noqa: E402
+from broadlink_ac_mqtt.publish_queue import PublishQueue  # noqa: E402
+
+FLEET = 100
+ROUNDS = 10
+
+
+class NullSocket:
+    def close(self):
+        pass
+
+
+class ConnectedClient(mqtt.Client):
+    """Client that takes every message without a broker, packets are built and then dropped."""
+
+    def __init__(self):
+        super().__init__(client_id="bench")
+        self._sock = NullSocket()
+        self.packets = 0
+
+    def is_connected(self):
+        return True
+
+    def _packet_queue(self, command, packet, mid, qos, info=None):
+        self.packets += 1
+        return mqtt.MQTT_ERR_SUCCESS
+
+
+def make_adapter():
+    adapter = AcToMqtt({'mqtt_topic_prefix': '/aircon/', 'mqtt_heartbeat_interval': 0})
+    adapter.previous_status = {}
+    adapter.last_full_publish = {}
+    adapter._mqtt = ConnectedClient()
+    adapter.publish_queue = PublishQueue(adapter._mqtt, max_inflight=10 ** 9)
+    return adapter
+
+
+class BeforeAdapter(AcToMqtt):
+    def publish_mqtt_info(self, status, force_update=False):
+        for key in status:
+            value = status[key]
+            if not force_update and status['macaddress'] in self.previous_status:
+                if self.previous_status[status['macaddress']].get(key) == value:
+                    continue
+            self._publish(self.config["mqtt_topic_prefix"] + status['macaddress'] + '/' + key + '/value', value)
+        self.previous_status[status['macaddress']] = status
+
+
+def make_statuses(rng):
+    statuses = []
+    for index in range(FLEET):
+        device = ac_db.__new__(ac_db)
+        device.status = AcStatus()
+        device._nice_status = None
+        device._nice_version = None
+        device.set_default_values()
+        device.status['macaddress'] = format(index, '012x')
+        device.status['temp'] = rng.randrange(32, 65) / 2
+        device.status['ambient_temp'] = rng.randrange(10, 35)
+        device.status['mode'] = rng.choice((0, 1, 4))
+        statuses.append(device.make_nice_status(device.status))
+    return statuses
+
+
+def main():
+    statuses = make_statuses(random.Random(1))
+    fields = sum(len(status) for status in statuses)
+
+    before = make_adapter()
+    before.__class__ = BeforeAdapter
+    after = make_adapter()
+
+    for adapter in (before, after):
+        for status in statuses:
+            adapter.publish_mqtt_info(status, force_update=True)
+        assert adapter._mqtt.packets == fields
+
+    client = ConnectedClient()
+    messages = [(after.topics(status['macaddress']).value[key], value)
+                for status in statuses for key, value in status.items()]
+
+    def paho_round():
+        for topic, value in messages:
+            client.publish(topic, payload=value)
+
+    def adapter_round(adapter):
+        def fleet_round():
+            for status in statuses:
+                adapter.publish_mqtt_info(status, force_update=True)
+        return fleet_round
+
+    for name, fleet_round in (("before", adapter_round(before)), ("after", adapter_round(after)),
+                              ("paho", paho_round)):
+        seconds = min(timeit.repeat(fleet_round, number=ROUNDS, repeat=5)) / ROUNDS
+        print(f"{name:<8} {seconds / fields * 1e6:>8.2f} us/field {seconds * 1000:>8.2f} ms CPU per second "
+              f"of a {FLEET} device 1 Hz fleet ({fields} fields)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+"""Wake-ups, poll period accuracy and burst size of the poll loop for a 50 device fleet, on a virtual clock.
+
+Run from the repository root: python benchmarks/bench_scheduler.py
+"Before" models the old loop, which checked every device and slept 0.5 s whenever none was due.
+A round of concurrent polls takes POLL_TIME, one virtual hour is simulated. Idle wake-ups are the ones
+that find no device due.
+"""
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from broadlink_ac_mqtt.scheduler import DeadlineScheduler, VirtualClock  # noqa: E402
+
+DEVICES = 50
+DURATION = 3600
+INTERVALS = [10 if index % 2 else 7 for index in range(DEVICES)]
+POLL_TIME = 0.15
+
+
+def report(name, idle, polls):
+    errors = []
+    for index, times in polls.items():
+        errors += [abs(b - a - INTERVALS[index]) for a, b in zip(times, times[1:])]
+    bursts = {}
+    for times in polls.values():
+        for at in times:
+            bursts[at] = bursts.get(at, 0) + 1
+    print(f"{name:<8} {idle:>8} idle wake-ups {statistics.mean(errors) * 1000:>8.1f} ms mean period error "
+          f"{max(bursts.values()):>4} largest burst")
+
+
+def before():
+    clock = VirtualClock()
+    last_update = {}
+    polls = {index: [] for index in range(DEVICES)}
+    idle = 0
+    while clock() < DURATION:
+        due = [index for index in range(DEVICES) if last_update.get(index, -DURATION) + INTERVALS[index] <= clock()]
+        if not due:
+            idle += 1
+            clock.sleep(0.5)
+            continue
+        for index in due:
+            polls[index].append(clock())
+        clock.sleep(POLL_TIME)
+        for index in due:
+            last_update[index] = clock()
+    report("before", idle, polls)
+
+
+def after():
+    clock = VirtualClock()
+    scheduler = DeadlineScheduler(clock=clock, sleep=clock.sleep)
+    polls = {index: [] for index in range(DEVICES)}
+    for index in range(DEVICES):
+        scheduler.schedule_spread(index, INTERVALS[index])
+    idle = 0
+    while clock() < DURATION:
+        started = clock()
+        due = scheduler.pop_due()
+        if not due:
+            idle += 1
+        for index in due:
+            polls[index].append(clock())
+        if due:
+            clock.sleep(POLL_TIME)
+        for index in due:
+            scheduler.schedule_at(index, started + INTERVALS[index])
+        scheduler.wait()
+    report("after", idle, polls)
+
+
+if __name__ == "__main__":
+    before()
+    after()
@@ -0,0 +1,31 @@
+#!/usr/bin/python
+"""Decode throughput of the table driven AC state codec.
+
+Run from the repository root: python benchmarks/bench_state_codec.py
+"Before" is the hand written decoding get_ac_states used, kept here for comparison. The compiled decoders
+run at about the same rate as the hand written shifts, this only guards against the table costing speed.
+The round trip is checked by tests/test_state_codec.py.
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from broadlink_ac_mqtt.ac_communication.broadlink.state_codec import AC_STATE_CODEC  # noqa: E402
+from tests.reference import legacy_decode_state, random_state  # noqa: E402
+
+
+def main(number=200000):
+    block = AC_STATE_CODEC.encode(random_state(random.Random(2)))
+    status = {}
+    for name, func in (("before (dict)", lambda: legacy_decode_state(block, status)),
+                       ("after (dict)", lambda: AC_STATE_CODEC.decode_into(block, status)),
+                       ("after (tuple)", lambda: AC_STATE_CODEC.decode(block))):
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"decode {name:<14} {number / seconds:>12,.0f} states/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 #!/usr/bin/python
 # -*- coding: utf8 -*-
 
+import asyncio
 import struct
 import time
 
+from broadlink_ac_mqtt.ac_communication.broadlink.ac_status import AcStatus
 from broadlink_ac_mqtt.ac_communication.broadlink.device import device
+from broadlink_ac_mqtt.ac_communication.broadlink.frame_codec import FrameCodec
+from broadlink_ac_mqtt.ac_communication.broadlink.state_codec import AC_STATE_CODEC
+from broadlink_ac_mqtt.metrics import metrics
 
 
 class ac_db(device):
@@ -53,17 +58,28 @@ class ac_db(device):
             OFF = 0
             ON = 1
 
-    def __init__(self, host, mac, name=None, cloud=None, debug=False, update_interval=0, devtype=None, bind_to_ip=None):
+    def __init__(self, host, mac, name=None, cloud=None, debug=False, update_interval=0, devtype=None, bind_to_ip=None,
+                 session_cache=None, info_interval=60, state_interval=0, state_max_age=10, connect=True):
 
         device.__init__(self, host, mac, name=name, cloud=cloud, devtype=devtype, update_interval=update_interval,
-                        bind_to_ip=bind_to_ip)
+                        bind_to_ip=bind_to_ip, session_cache=session_cache)
 
         devtype = devtype
-        self.status = {}
+        self.status = AcStatus()
+        # make_nice_status result and the status version it was made from
+        self._nice_status = None
+        self._nice_version = None
         self.original_config = None
         self.logger = self.logging.getLogger(__name__)
 
         self.update_interval = update_interval
+        # Ambient temperature changes slowly, so info and states are refreshed on their own intervals
+        self.info_interval = info_interval
+        self.state_interval = state_interval
+        self.info_lastupdate = 0
+        # Setters send the cached state without reading it first while it is at most this old
+        self.state_max_age = state_max_age
+        self.last_write_rejected = False
 
         ##Set default values
         # mac = mac[::-1]
@@ -77,34 +93,57 @@ class ac_db(device):
         self.logging.basicConfig(level=(self.logging.DEBUG if debug else self.logging.INFO))
         self.logger.debug("Debugging Enabled")
 
+        # Without connect the device is built without any I/O, async_connect does the rest later
+        if connect:
+            self._run(self.async_connect())
+
+    async def async_connect(self):
+        """Authenticate and get the first status, None if authentication failed."""
         ##Populate array with latest data
         self.logger.debug("Authenticating")
-        if self.auth() == False:
-            self.logger.critical(f"Authentication Failed to AC: {name} ({host}). skipping")
+        if await self.async_login() == False:
+            self.logger.critical(f"Authentication Failed to AC: {self.name} ({self.host}). skipping")
             return None
 
-        self.logger.info(f"Authenticated to AC: {name} ({host}).")
+        self.logger.info(f"Authenticated to AC: {self.name} ({self.host}).")
         self.logger.debug("Getting current details in init")
 
         ##Get the current details
-        self.get_ac_status(force_update=True)
+        return await self.async_get_ac_status(force_update=True)
 
     def get_ac_status(self, force_update=False):
+        return self._run(self.async_get_ac_status(force_update))
+
+    async def async_get_ac_status(self, force_update=False):
         # Check if the status is up-to-date to reduce timeout issues. Can be overwritten by force_update
         self.logger.debug(f"Last update was: {self.status['lastupdate']}")
 
         if force_update is False and (self.status['lastupdate'] + self.update_interval) > time.time():
             return self.make_nice_status(self.status)
 
-        # Get AC info(also populates the current temp)
-        self.logger.debug("Getting AC Info")
-        self.get_ac_info()
-        self.logger.debug("AC Info Retrieved")
-        # Get the current status ... get_ac_states does make_nice_status in return.
-        self.logger.debug("Getting AC States")
-        status = self.get_ac_states(True)
-        self.logger.debug("AC States retrieved")
-        return status
+        now = time.time()
+        states_due = force_update or (self.status['lastupdate'] + self.state_interval) <= now
+        info_due = force_update or (self.info_lastupdate + self.info_interval) <= now
+
+        # Get AC info (also populates the current temp) and the current states, both at once when both are due
+        requests = []
+        if states_due:
+            self.logger.debug("Getting AC States")
+            requests.append(self.async_get_ac_states(True))
+        if info_due:
+            self.logger.debug("Getting AC Info")
+            requests.append(self.async_get_ac_info())
+        if not requests:
+            return self.make_nice_status(self.status)
+
+        results = await asyncio.gather(*requests)
+        self.logger.debug("AC Info and States retrieved")
+
+        # A failed states read is passed on. Otherwise the status is made after both replies are in, the info
+        # reply may have come in after get_ac_states made its nice status
+        if states_due and not results[0]:
+            return results[0]
+        return self.make_nice_status(self.status)
 
     def set_default_values(self):
 
@@ -128,271 +167,166 @@ class ac_db(device):
         self.status['ambient_temp'] = None
         self.status['devicename'] = None
 
-    def set_temperature(self, temperature):
-        self.logger.debug("Setting temperature to %s", temperature)
-        self.get_ac_states()
-        self.status['temp'] = float(temperature)
+    def apply_changes(self, changes):
+        """Apply a dict of raw field changes to the current state and send it in one set_ac_status."""
+        return self._run(self.async_apply_changes(changes))
 
-        self.set_ac_status()
-        return self.make_nice_status(self.status)
-
-    def switch_off(self):
+    async def async_apply_changes(self, changes):
         ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
-        self.status['power'] = self.STATIC.ONOFF.OFF
-        self.set_ac_status()
-        return self.make_nice_status(self.status)
+        if self.state_is_fresh():
+            metrics.increment('prereads_avoided', device=self.status['macaddress'])
+        else:
+            metrics.increment('prereads', device=self.status['macaddress'])
+            await self.async_get_ac_states(force_update=True)
 
-    def switch_on(self):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
-        self.status['power'] = self.STATIC.ONOFF.ON
-        self.set_ac_status()
+        # Repeating what the AC already does costs no write at all
+        if all(self.status[key] == value for key, value in changes.items()):
+            metrics.increment('writes_skipped', device=self.status['macaddress'])
+            return self.make_nice_status(self.status)
 
+        previous = {key: self.status[key] for key in changes}
+        for key, value in changes.items():
+            self.status[key] = value
+        try:
+            await self.async_set_ac_status()
+        finally:
+            # The status keeps what the AC has, a write it didn't take is undone here
+            if self.last_write_rejected:
+                for key, value in previous.items():
+                    self.status[key] = value
         return self.make_nice_status(self.status)
 
-    def set_mode(self, mode_text):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
-
-        mode = self.STATIC.MODE.__dict__.get(mode_text.upper())
-        if mode != None:
-            self.status['mode'] = mode
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found mode value %s", str(mode_text))
+    def state_is_fresh(self):
+        """Whether the cached state can be sent as is, a rejected write always forces a new read."""
+        if self.last_write_rejected or not self.status['lastupdate']:
             return False
+        return time.time() - self.status['lastupdate'] <= self.state_max_age
 
-    def set_fanspeed(self, mode_text):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
-
-        mode = self.STATIC.FAN.__dict__.get(mode_text.upper())
-        if mode != None:
-            self.status['fanspeed'] = mode
-            self.status['turbo'] = self.STATIC.ONOFF.OFF
-            self.status['mute'] = self.STATIC.ONOFF.OFF
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found mode value %s", str(mode_text))
+    def _set(self, changes, name, value):
+        if changes is None:
+            self.logger.debug("Not found %s value %s", name, str(value))
             return False
+        return self.apply_changes(changes)
 
-    def set_mute(self, value):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
-
-        mode = self.STATIC.ONOFF.__dict__.get(value)
-        if mode != None:
-            self.status['mute'] = mode
-            self.status['turbo'] = self.STATIC.ONOFF.OFF
-            self.status['fanspeed'] = self.STATIC.FAN.NONE
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found mute value %s", str(value))
-            return False
+    ## Field changes of each setting, computed without any I/O so several can be merged into one set_ac_status
+    def temperature_changes(self, temperature):
+        # Limited to what the AC accepts, as set_ac_status would do
+        return {'temp': min(float(32), max(float(16), float(temperature)))}
 
-    def set_turbo(self, value):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
-
-        mode = self.STATIC.ONOFF.__dict__.get(value)
-        if mode != None:
-            self.status['turbo'] = mode
-            self.status['mute'] = self.STATIC.ONOFF.OFF
-            self.status['fanspeed'] = self.STATIC.FAN.NONE
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found Turbo value %s", str(value))
-            return False
+    def power_changes(self, value):
+        power = _ONOFF_VALUES.get(value.upper())
+        return None if power is None else {'power': power}
 
-    def set_fixation_v(self, fixation_text):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
+    def mode_changes(self, mode_text):
+        mode = _MODE_VALUES.get(mode_text.upper())
+        return None if mode is None else {'mode': mode}
 
-        fixation = self.STATIC.FIXATION.VERTICAL.__dict__.get(fixation_text.upper())
-        if fixation != None:
-            self.status['fixation_v'] = fixation
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found mode value %s", str(fixation_text))
-            return False
+    def fanspeed_changes(self, mode_text):
+        fanspeed = _FAN_VALUES.get(mode_text.upper())
+        if fanspeed is None:
+            return None
+        return {'fanspeed': fanspeed, 'turbo': self.STATIC.ONOFF.OFF, 'mute': self.STATIC.ONOFF.OFF}
 
-    def set_fixation_h(self, fixation_text):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
+    def mute_changes(self, value):
+        mute = _ONOFF_VALUES.get(value)
+        if mute is None:
+            return None
+        return {'mute': mute, 'turbo': self.STATIC.ONOFF.OFF, 'fanspeed': self.STATIC.FAN.NONE}
 
-        fixation = self.STATIC.FIXATION.HORIZONTAL.__dict__.get(fixation_text.upper())
-        if fixation != None:
-            self.status['fixation_h'] = fixation
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found mode value %s", str(fixation_text))
-            return False
+    def turbo_changes(self, value):
+        turbo = _ONOFF_VALUES.get(value)
+        if turbo is None:
+            return None
+        return {'turbo': turbo, 'mute': self.STATIC.ONOFF.OFF, 'fanspeed': self.STATIC.FAN.NONE}
 
-    def set_display(self, value):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
+    def fixation_v_changes(self, fixation_text):
+        fixation = _FIXATION_V_VALUES.get(fixation_text.upper())
+        return None if fixation is None else {'fixation_v': fixation}
 
-        mode = self.STATIC.ONOFF.__dict__.get(value)
-        if mode != None:
-            self.status['display'] = mode
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found display value %s", str(value))
-            return False
+    def fixation_h_changes(self, fixation_text):
+        fixation = _FIXATION_H_VALUES.get(fixation_text.upper())
+        return None if fixation is None else {'fixation_h': fixation}
 
-    def set_mildew(self, value):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
+    def onoff_changes(self, key, value):
+        """Changes of one of the plain on/off settings: display, mildew, clean, health or sleep."""
+        onoff = _ONOFF_VALUES.get(value)
+        return None if onoff is None else {key: onoff}
 
-        mode = self.STATIC.ONOFF.__dict__.get(value)
-        if mode != None:
-            self.status['mildew'] = mode
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found display value %s", str(value))
-            return False
+    def homekit_mode_changes(self, status):
+        if type(status) is not str:
+            return None
+        return _HOMEKIT_MODE_CHANGES.get(status.lower())
 
-    def set_clean(self, value):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
+    def homeassistant_mode_changes(self, status):
+        if type(status) is not str:
+            return None
+        return _HOMEASSISTANT_MODE_CHANGES.get(status.lower())
 
-        mode = self.STATIC.ONOFF.__dict__.get(value)
-        if mode != None:
-            self.status['clean'] = mode
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found display value %s", str(value))
-            return False
+    def set_temperature(self, temperature):
+        self.logger.debug("Setting temperature to %s", temperature)
+        return self.apply_changes(self.temperature_changes(temperature))
 
-    def set_health(self, value):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
+    def switch_off(self):
+        return self.apply_changes({'power': self.STATIC.ONOFF.OFF})
 
-        mode = self.STATIC.ONOFF.__dict__.get(value)
-        if mode != None:
-            self.status['health'] = mode
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found display value %s", str(value))
-            return False
+    def switch_on(self):
+        return self.apply_changes({'power': self.STATIC.ONOFF.ON})
 
-    def set_sleep(self, value):
-        ##Make sure latest info as cannot just update one things, have set all
-        self.get_ac_states()
+    def set_mode(self, mode_text):
+        return self._set(self.mode_changes(mode_text), "mode", mode_text)
 
-        mode = self.STATIC.ONOFF.__dict__.get(value)
-        if mode != None:
-            self.status['sleep'] = mode
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug("Not found display value %s", str(value))
-            return False
+    def set_fanspeed(self, mode_text):
+        return self._set(self.fanspeed_changes(mode_text), "mode", mode_text)
 
-    def set_homekit_mode(self, status):
-        if type(status) is not str:
-            self.logger.debug('Status variable is not string %s', type(status))
-            return False
+    def set_mute(self, value):
+        return self._set(self.mute_changes(value), "mute", value)
 
-        if status.lower() == 'coolon':
-            self.status['mode'] = self.STATIC.MODE.COOLING
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        elif status.lower() == 'heaton':
-            self.status['mode'] = self.STATIC.MODE.HEATING
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
+    def set_turbo(self, value):
+        return self._set(self.turbo_changes(value), "Turbo", value)
 
-        elif status.lower() == 'auto':
-            self.status['mode'] = self.STATIC.MODE.AUTO
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
+    def set_fixation_v(self, fixation_text):
+        return self._set(self.fixation_v_changes(fixation_text), "mode", fixation_text)
 
-        if status.lower() == 'dry':
-            self.status['mode'] = self.STATIC.MODE.DRY
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        if status.lower() == 'fan_only':
-            self.status['mode'] = self.STATIC.MODE.FAN
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        elif status.lower() == "off":
-            self.status['power'] = self.STATIC.ONOFF.OFF
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug('Invalid status for homekit %s', status)
-            return False
+    def set_fixation_h(self, fixation_text):
+        return self._set(self.fixation_h_changes(fixation_text), "mode", fixation_text)
 
-    def set_homeassistant_mode(self, status):
-        if type(status) is not str:
-            self.logger.debug('Status variable is not string %s', type(status))
-            return False
+    def set_display(self, value):
+        return self._set(self.onoff_changes('display', value), "display", value)
 
-        if status.lower() == 'cool':
-            self.status['mode'] = self.STATIC.MODE.COOLING
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        elif status.lower() == 'heat':
-            self.status['mode'] = self.STATIC.MODE.HEATING
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
+    def set_mildew(self, value):
+        return self._set(self.onoff_changes('mildew', value), "mildew", value)
 
-        elif status.lower() == 'auto':
-            self.status['mode'] = self.STATIC.MODE.AUTO
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
+    def set_clean(self, value):
+        return self._set(self.onoff_changes('clean', value), "clean", value)
 
-        if status.lower() == 'dry':
-            self.status['mode'] = self.STATIC.MODE.DRY
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        if status.lower() == 'fan_only':
-            self.status['mode'] = self.STATIC.MODE.FAN
-            self.status['power'] = self.STATIC.ONOFF.ON
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        elif status.lower() == "off":
-            self.status['power'] = self.STATIC.ONOFF.OFF
-            self.set_ac_status()
-            return self.make_nice_status(self.status)
-        else:
-            self.logger.debug('Invalid status for homekit %s', status)
-            return False
+    def set_health(self, value):
+        return self._set(self.onoff_changes('health', value), "health", value)
+
+    def set_sleep(self, value):
+        return self._set(self.onoff_changes('sleep', value), "sleep", value)
+
+    def set_homekit_mode(self, status):
+        return self._set(self.homekit_mode_changes(status), "homekit", status)
+
+    def set_homeassistant_mode(self, status):
+        return self._set(self.homeassistant_mode_changes(status), "homeassistant", status)
 
     def get_ac_info(self):
+        return self._run(self.async_get_ac_info())
+
+    async def async_get_ac_info(self):
         GET_AC_INFO = bytearray.fromhex("0C00BB0006800000020021011B7E0000")
-        response = self.send_packet(0x6a, GET_AC_INFO)
+        response = await self.async_send_packet(0x6a, GET_AC_INFO)
         # print "Response:" + ''.join(format(x, '02x') for x in response)
         # print "Response:" + ' '.join(format(x, '08b') for x in response[9:])
 
-        err = response[0x22] | (response[0x23] << 8)
+        err = FrameCodec.error_code(response)
         if err == 0:
 
             # response = bytearray.fromhex("5aa5aa555aa5aa55000000000000000000000000000000000000000000000000c6d000002a4e6a0055b9af41a70d43b401000000b9c00000aeaac104468cf91b485f38c67f7bf57f");
             # response = bytearray.fromhex("5aa5aa555aa5aa5547006f008d9904312c003e00000000003133a84d00400000d8d500002a4e6a0070a1b88c08b043a001000000b9c0000038821c66e3b38a5afe79dcb145e215d7")
 
-            response_payload = self.decrypt(bytes(response[0x38:]))
+            response_payload = self.decrypt(FrameCodec.payload(response))
             response_payload = bytearray(response_payload)
 
             self.logger.debug("Acinfo Raw Response: " + ' '.join(format(x, '08b') for x in response_payload))
@@ -412,6 +346,7 @@ class ac_db(device):
 
             if ambient_temp:
                 self.status['ambient_temp'] = ambient_temp
+            self.info_lastupdate = time.time()
 
             return self.make_nice_status(self.status)
         else:
@@ -423,6 +358,15 @@ class ac_db(device):
     ## GEt the current status of the aircon and parse into status array a one have to send full status each time for update, cannot just send one setting
     ##
     def get_ac_states(self, force_update=False):
+        return self._run(self.async_get_ac_states(force_update))
+
+    async def async_probe(self, timeout=1):
+        """Single cheap request to find out whether an unreachable device answers again."""
+        # It may have rebooted in the meantime, check the session on the reply and re-authenticate if needed
+        self._session_unverified = True
+        return await self.async_get_ac_states(force_update=True, timeout=timeout)
+
+    async def async_get_ac_states(self, force_update=False, timeout=None):
         GET_STATES = bytearray.fromhex(
             "0C00BB0006800000020011012B7E0000")  ##From app queryAuxinfo:bb0006800000020011012b7e
 
@@ -431,13 +375,13 @@ class ac_db(device):
         if force_update == False and (self.status['lastupdate'] + self.update_interval) > time.time():
             return self.make_nice_status(self.status)
 
-        response = self.send_packet(0x6a, GET_STATES)
+        response = await self.async_send_packet(0x6a, GET_STATES, timeout)
         ##Check response, the checksums should be 0
-        err = response[0x22] | (response[0x23] << 8)
+        err = FrameCodec.error_code(response)
 
         if err == 0:
 
-            response_payload = bytes(self.decrypt(bytes(response[0x38:])))
+            response_payload = self.decrypt(FrameCodec.payload(response))
 
             response_payload = bytearray(response_payload)
             packet_type = response_payload[4]
@@ -457,22 +401,11 @@ class ac_db(device):
 
             # AuxInfo [tem=18, panMode=7, panType=1, nowTimeHour=5, setTem05=0, antoSenseYards=0, nowTimeMin=51, windSpeed=5, timerHour=0, voice=0, timerMin=0, mode=4, hasDew=0, hasSenseYards=0, hasSleep=0, isFollow=0, roomTem=0, roomHum=0, timeEnable=0, open=1, hasElectHeat=0, hasEco=0, hasClean=0, hasHealth=0, hasAir=0, weedSet=0, electronicLock=0, showDisplyBoard=1, mouldProof=0, controlMode=0, sleepMode=0]
 
-            self.status['temp'] = 8 + (response_payload[10] >> 3) + (0.5 * float(response_payload[12] >> 7))
-            self.status['power'] = response_payload[18] >> 5 & 0b00000001
-            self.status['fixation_v'] = response_payload[10] & 0b00000111
-            self.status['mode'] = response_payload[15] >> 5 & 0b00001111
-            self.status['sleep'] = response_payload[15] >> 2 & 0b00000001
-            self.status['display'] = response_payload[20] >> 4 & 0b00000001
-            self.status['mildew'] = response_payload[20] >> 3 & 0b00000001
-            self.status['health'] = response_payload[18] >> 1 & 0b00000001
-            self.status['fixation_h'] = response_payload[10] & 0b00000111
-            self.status['fanspeed'] = response_payload[13] >> 5 & 0b00000111
-            self.status['ifeel'] = response_payload[15] >> 3 & 0b00000001
-            self.status['mute'] = response_payload[14] >> 7 & 0b00000001
-            self.status['turbo'] = response_payload[14] >> 6 & 0b00000001
-            self.status['clean'] = response_payload[18] >> 2 & 0b00000001
+            self.status.update_decoded(AC_STATE_CODEC.names, AC_STATE_CODEC.decode(response_payload))
 
             self.status['lastupdate'] = time.time()
+            # Whatever a rejected write left behind has been overwritten by the real state
+            self.last_write_rejected = False
 
             return self.make_nice_status(self.status)
 
@@ -480,66 +413,20 @@ class ac_db(device):
             return 0
 
     def make_nice_status(self, status):
-        status_nice = {}
-        status_nice['temp'] = status['temp']
-        status_nice['ambient_temp'] = status['ambient_temp']
-        status_nice['power'] = self.get_key(self.STATIC.ONOFF.__dict__, status['power'])
-        status_nice['fixation_v'] = self.get_key(self.STATIC.FIXATION.VERTICAL.__dict__, status['fixation_v'])
-        status_nice['mode'] = self.get_key(self.STATIC.MODE.__dict__, status['mode'])
-        status_nice['sleep'] = self.get_key(self.STATIC.ONOFF.__dict__, status['sleep'])
-        status_nice['display'] = self.get_key(self.STATIC.ONOFF.__dict__, status['display'])
-        status_nice['mildew'] = self.get_key(self.STATIC.ONOFF.__dict__, status['mildew'])
-        status_nice['health'] = self.get_key(self.STATIC.ONOFF.__dict__, status['health'])
-        status_nice['fixation_h'] = self.get_key(self.STATIC.FIXATION.HORIZONTAL.__dict__, status['fixation_h'])
-
-        status_nice['ifeel'] = self.get_key(self.STATIC.ONOFF.__dict__, status['ifeel'])
-        status_nice['mute'] = self.get_key(self.STATIC.ONOFF.__dict__, status['mute'])
-        status_nice['turbo'] = self.get_key(self.STATIC.ONOFF.__dict__, status['turbo'])
-        status_nice['clean'] = self.get_key(self.STATIC.ONOFF.__dict__, status['clean'])
-
-        status_nice['macaddress'] = status['macaddress']
-        status_nice['device_name'] = status['devicename']
-
-        ##HomeKit topics
-        if self.status['power'] == self.STATIC.ONOFF.OFF:
-            status_nice['mode_homekit'] = "Off"
-        elif status['power'] == self.STATIC.ONOFF.ON and status['mode'] == self.STATIC.MODE.AUTO:
-            status_nice['mode_homekit'] = "Auto"
-        elif status['power'] == self.STATIC.ONOFF.ON and status['mode'] == self.STATIC.MODE.HEATING:
-            status_nice['mode_homekit'] = "HeatOn"
-        elif status['power'] == self.STATIC.ONOFF.ON and status['mode'] == self.STATIC.MODE.COOLING:
-            status_nice['mode_homekit'] = "CoolOn"
-        else:
-            status_nice['mode_homekit'] = "Error"
-
-        ##Home Assist topic
-        if self.status['power'] == self.STATIC.ONOFF.OFF:
-            status_nice['mode_homeassistant'] = "off"
-        elif status['power'] == self.STATIC.ONOFF.ON and status['mode'] == self.STATIC.MODE.AUTO:
-            status_nice['mode_homeassistant'] = "auto"
-        elif status['power'] == self.STATIC.ONOFF.ON and status['mode'] == self.STATIC.MODE.HEATING:
-            status_nice['mode_homeassistant'] = "heat"
-        elif status['power'] == self.STATIC.ONOFF.ON and status['mode'] == self.STATIC.MODE.COOLING:
-            status_nice['mode_homeassistant'] = "cool"
-        elif status['power'] == self.STATIC.ONOFF.ON and status['mode'] == self.STATIC.MODE.DRY:
-            status_nice['mode_homeassistant'] = "dry"
-        elif status['power'] == self.STATIC.ONOFF.ON and status['mode'] == self.STATIC.MODE.FAN:
-            status_nice['mode_homeassistant'] = "fan_only"
-        else:
-            status_nice['mode_homeassistant'] = "Error"
-
-        ##Make fanspeed logic
-        status_nice['fanspeed'] = self.get_key(self.STATIC.FAN.__dict__, status['fanspeed'])
-        status_nice['fanspeed_homeassistant'] = self.get_key(self.STATIC.FAN.__dict__, status['fanspeed']).title()
-
-        if status_nice['mute'] == "ON":
-            status_nice['fanspeed_homeassistant'] = "Mute"
-            status_nice['fanspeed'] = "MUTE"
-        elif status_nice['turbo'] == "ON":
-            status_nice['fanspeed_homeassistant'] = "Turbo"
-            status_nice['fanspeed'] = "TURBO"
-
-        return status_nice
+        # Cached until the raw status changes, callers must not modify the returned dict
+        if status is self.status:
+            if self._nice_version == status.version:
+                return self._nice_status
+            self._nice_status = _make_nice_status(status)
+            self._nice_version = status.version
+            return self._nice_status
+        return _make_nice_status(status)
+
+    def expected_nice_status(self, changes):
+        """Nice status once the raw field changes are applied, without touching the status or its cache."""
+        expected = {key: self.status[key] for key in self.status}
+        expected.update(changes)
+        return _make_nice_status(expected)
 
     def get_key(self, list, search_value):
 
@@ -566,57 +453,21 @@ class ac_db(device):
         return checksum
 
     def set_ac_status(self):
+        return self._run(self.async_set_ac_status())
+
+    async def async_set_ac_status(self):
         self.logger.debug("Start set_ac_status")
         # packet = bytearray(32)
         # 10111011 00000000 00000110 10000000 00000000 00000000 00001111 00000000 00000001 9 00000001 10 01000111 11 00101000  12 00100000 13 10100000 14 00000000 15 00100000  16 00000000 17 00000000 18 00100000 19 00000000 20 00010000 21 00000000 22 00000101 10010001 10010101
 
+        ##Make sure to fix the global status as well
         if self.status['temp'] < 16:
-            temperature = 16 - 8
-            temperature_05 = 0
-
-            ##Make sure to fix the global status as well
-            self.status['temp'] = 16
-
+            self.status['temp'] = float(16)
         elif self.status['temp'] > 32:
-            temperature = 32 - 8
-            temperature_05 = 0
-            ##Make sure to fix the global status as well
-            self.status['temp'] = 32
+            self.status['temp'] = float(32)
 
-        else:
-            ##if 0.5 then make true	. Also  offset with 8
-            if self.status['temp'].is_integer():
-                temperature = int(self.status['temp'] - 8)
-                temperature_05 = 0
-            else:
-                temperature_05 = 1
-                temperature = int(self.status['temp'] - 8)
-
-        payload = bytearray(23)
-        payload[0] = 0xbb
-        payload[1] = 0x00
-        payload[2] = 0x06  # Send command, seems like 07 is response
-        payload[3] = 0x80
-        payload[4] = 0x00
-        payload[5] = 0x00
-        payload[6] = 0x0f  # Set status .. #02 -> get info?
-        payload[7] = 0x00
-        payload[8] = 0x01
-        payload[9] = 0x01
-        payload[10] = 0b00000000 | temperature << 3 | self.status['fixation_v']
-        payload[11] = 0b00000000 | self.status['fixation_h'] << 5
-        payload[
-            12] = 0b00001111 | temperature_05 << 7  # bit 1:  0.5  #bit   if 0b?1 then nothing done....  last 6 is some sort of packet_id
-        payload[13] = 0b00000000 | self.status['fanspeed'] << 5
-        payload[14] = 0b00000000 | self.status['turbo'] << 6 | self.status['mute'] << 7
-        payload[15] = 0b00000000 | self.status['mode'] << 5 | self.status['sleep'] << 2
-        payload[16] = 0b00000000
-        payload[17] = 0x00
-        payload[18] = 0b00000000 | self.status['power'] << 5 | self.status['health'] << 1 | self.status['clean'] << 2
-        payload[19] = 0x00
-        payload[20] = 0b00000000 | self.status['display'] << 4 | self.status['mildew'] << 3
-        payload[21] = 0b00000000
-        payload[22] = 0b00000000
+        # Any fraction of a degree is sent as .5
+        payload = AC_STATE_CODEC.encode(self.status)
 
         self.logger.debug("Payload:" + ''.join(format(x, '02x') for x in payload))
 
@@ -633,17 +484,24 @@ class ac_db(device):
 
         self.logger.debug("Packet:" + ''.join(format(x, '02x') for x in request_payload))
 
-        response = self.send_packet(0x6a, request_payload)
+        # Only cleared once the device accepted the write
+        self.last_write_rejected = True
+        response = await self.async_send_packet(0x6a, request_payload)
         self.logger.debug("Resposnse:" + ''.join(format(x, '02x') for x in response))
 
-        err = response[0x22] | (response[0x23] << 8)
+        err = FrameCodec.error_code(response)
         if err == 0:
 
-            response_payload = self.decrypt(bytes(response[0x38:]))
+            response_payload = self.decrypt(FrameCodec.payload(response))
             response_payload = bytearray(response_payload)
 
             packet_type = response_payload[4]
             if packet_type == 0x07:  ##Should be result packet, otherwise something weird
+                self.last_write_rejected = False
+                # A reply carrying the state block is what the AC accepted, it counts as a fresh read
+                if response_payload[0] == 0x19 and len(response_payload) >= 0x19:
+                    self.status.update_decoded(AC_STATE_CODEC.names, AC_STATE_CODEC.decode(response_payload[2:]))
+                    self.status['lastupdate'] = time.time()
                 return self.status
             else:
                 return False
@@ -651,3 +509,110 @@ class ac_db(device):
             self.logger.debug("Payload: Nice:" + ''.join(x.encode('hex') for x in response_payload))
 
         return "done"
+
+
+def _values_by_name(constants):
+    return {key: value for key, value in vars(constants).items() if not key.startswith('__')}
+
+
+def _names_by_value(constants):
+    # First name wins where several share a value, as get_key did
+    names = {}
+    for key, value in vars(constants).items():
+        if not key.startswith('__'):
+            names.setdefault(value, key)
+    return names
+
+
+_ONOFF_VALUES = _values_by_name(ac_db.STATIC.ONOFF)
+_FIXATION_V_VALUES = _values_by_name(ac_db.STATIC.FIXATION.VERTICAL)
+_FIXATION_H_VALUES = _values_by_name(ac_db.STATIC.FIXATION.HORIZONTAL)
+_MODE_VALUES = _values_by_name(ac_db.STATIC.MODE)
+_FAN_VALUES = _values_by_name(ac_db.STATIC.FAN)
+
+_ON = ac_db.STATIC.ONOFF.ON
+_HOMEKIT_MODE_CHANGES = {
+    'coolon': {'mode': ac_db.STATIC.MODE.COOLING, 'power': _ON},
+    'heaton': {'mode': ac_db.STATIC.MODE.HEATING, 'power': _ON},
+    'auto': {'mode': ac_db.STATIC.MODE.AUTO, 'power': _ON},
+    'dry': {'mode': ac_db.STATIC.MODE.DRY, 'power': _ON},
+    'fan_only': {'mode': ac_db.STATIC.MODE.FAN, 'power': _ON},
+    'off': {'power': ac_db.STATIC.ONOFF.OFF},
+}
+_HOMEASSISTANT_MODE_CHANGES = {
+    'cool': _HOMEKIT_MODE_CHANGES['coolon'],
+    'heat': _HOMEKIT_MODE_CHANGES['heaton'],
+    'auto': _HOMEKIT_MODE_CHANGES['auto'],
+    'dry': _HOMEKIT_MODE_CHANGES['dry'],
+    'fan_only': _HOMEKIT_MODE_CHANGES['fan_only'],
+    'off': _HOMEKIT_MODE_CHANGES['off'],
+}
+
+_ONOFF_NAMES = _names_by_value(ac_db.STATIC.ONOFF)
+_FIXATION_V_NAMES = _names_by_value(ac_db.STATIC.FIXATION.VERTICAL)
+_FIXATION_H_NAMES = _names_by_value(ac_db.STATIC.FIXATION.HORIZONTAL)
+_MODE_NAMES = _names_by_value(ac_db.STATIC.MODE)
+_FAN_NAMES = _names_by_value(ac_db.STATIC.FAN)
+_FAN_HOMEASSISTANT_NAMES = {value: name.title() for value, name in _FAN_NAMES.items()}
+
+_MODE_HOMEKIT = {
+    ac_db.STATIC.MODE.AUTO: "Auto",
+    ac_db.STATIC.MODE.HEATING: "HeatOn",
+    ac_db.STATIC.MODE.COOLING: "CoolOn",
+}
+_MODE_HOMEASSISTANT = {
+    ac_db.STATIC.MODE.AUTO: "auto",
+    ac_db.STATIC.MODE.HEATING: "heat",
+    ac_db.STATIC.MODE.COOLING: "cool",
+    ac_db.STATIC.MODE.DRY: "dry",
+    ac_db.STATIC.MODE.FAN: "fan_only",
+}
+
+
+def _make_nice_status(status):
+    onoff = _ONOFF_NAMES.get
+    power = status['power']
+    mode = status['mode']
+    status_nice = {
+        'temp': status['temp'],
+        'ambient_temp': status['ambient_temp'],
+        'power': onoff(power, power),
+        'fixation_v': _FIXATION_V_NAMES.get(status['fixation_v'], status['fixation_v']),
+        'mode': _MODE_NAMES.get(mode, mode),
+        'sleep': onoff(status['sleep'], status['sleep']),
+        'display': onoff(status['display'], status['display']),
+        'mildew': onoff(status['mildew'], status['mildew']),
+        'health': onoff(status['health'], status['health']),
+        'fixation_h': _FIXATION_H_NAMES.get(status['fixation_h'], status['fixation_h']),
+        'ifeel': onoff(status['ifeel'], status['ifeel']),
+        'mute': onoff(status['mute'], status['mute']),
+        'turbo': onoff(status['turbo'], status['turbo']),
+        'clean': onoff(status['clean'], status['clean']),
+        'macaddress': status['macaddress'],
+        'device_name': status['devicename'],
+    }
+
+    ##HomeKit and Home Assist topics
+    if power == ac_db.STATIC.ONOFF.OFF:
+        status_nice['mode_homekit'] = "Off"
+        status_nice['mode_homeassistant'] = "off"
+    elif power == ac_db.STATIC.ONOFF.ON:
+        status_nice['mode_homekit'] = _MODE_HOMEKIT.get(mode, "Error")
+        status_nice['mode_homeassistant'] = _MODE_HOMEASSISTANT.get(mode, "Error")
+    else:
+        status_nice['mode_homekit'] = "Error"
+        status_nice['mode_homeassistant'] = "Error"
+
+    ##Make fanspeed logic
+    if status_nice['mute'] == "ON":
+        status_nice['fanspeed'] = "MUTE"
+        status_nice['fanspeed_homeassistant'] = "Mute"
+    elif status_nice['turbo'] == "ON":
+        status_nice['fanspeed'] = "TURBO"
+        status_nice['fanspeed_homeassistant'] = "Turbo"
+    else:
+        fanspeed = status['fanspeed']
+        status_nice['fanspeed'] = _FAN_NAMES.get(fanspeed, fanspeed)
+        status_nice['fanspeed_homeassistant'] = _FAN_HOMEASSISTANT_NAMES.get(fanspeed, fanspeed)
+
+    return status_nice
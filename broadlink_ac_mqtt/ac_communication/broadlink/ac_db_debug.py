@@ -1,10 +1,10 @@
-import socket
 import struct
 import time
 
 from broadlink_ac_mqtt.ac_communication.broadlink.ac_db import ac_db
 from broadlink_ac_mqtt.ac_communication.broadlink.device import device
-from broadlink_ac_mqtt.ac_communication.broadlink.connect_timeout import ConnectTimeout
+from broadlink_ac_mqtt.ac_communication.broadlink.frame_codec import FrameCodec
+from broadlink_ac_mqtt.ac_communication.broadlink.state_codec import AC_STATE_CODEC
 
 
 class ac_db_debug(device):
@@ -56,11 +56,11 @@ class ac_db_debug(device):
 
         response = self.send_packet(0x6a, GET_STATES)
         ##Check response, the checksums should be 0
-        err = response[0x22] | (response[0x23] << 8)
+        err = FrameCodec.error_code(response)
 
         if err == 0:
 
-            response_payload = bytes(self.decrypt(bytes(response[0x38:])))
+            response_payload = self.decrypt(FrameCodec.payload(response))
 
             response_payload = bytearray(response_payload)
             packet_type = response_payload[4]
@@ -80,20 +80,7 @@ class ac_db_debug(device):
 
             # AuxInfo [tem=18, panMode=7, panType=1, nowTimeHour=5, setTem05=0, antoSenseYards=0, nowTimeMin=51, windSpeed=5, timerHour=0, voice=0, timerMin=0, mode=4, hasDew=0, hasSenseYards=0, hasSleep=0, isFollow=0, roomTem=0, roomHum=0, timeEnable=0, open=1, hasElectHeat=0, hasEco=0, hasClean=0, hasHealth=0, hasAir=0, weedSet=0, electronicLock=0, showDisplyBoard=1, mouldProof=0, controlMode=0, sleepMode=0]
 
-            self.status['temp'] = 8 + (response_payload[10] >> 3) + (0.5 * float(response_payload[12] >> 7))
-            self.status['power'] = response_payload[18] >> 5 & 0b00000001
-            self.status['fixation_v'] = response_payload[10] & 0b00000111
-            self.status['mode'] = response_payload[15] >> 5 & 0b00001111
-            self.status['sleep'] = response_payload[15] >> 2 & 0b00000001
-            self.status['display'] = response_payload[20] >> 4 & 0b00000001
-            self.status['mildew'] = response_payload[20] >> 3 & 0b00000001
-            self.status['health'] = response_payload[18] >> 1 & 0b00000001
-            self.status['fixation_h'] = response_payload[11] >> 5 & 0b00000111
-            self.status['fanspeed'] = response_payload[13] >> 5 & 0b00000111
-            self.status['ifeel'] = response_payload[15] >> 3 & 0b00000001
-            self.status['mute'] = response_payload[14] >> 7 & 0b00000001
-            self.status['turbo'] = response_payload[14] >> 6 & 0b00000001
-            self.status['clean'] = response_payload[18] >> 2 & 0b00000001
+            AC_STATE_CODEC.decode_into(response_payload, self.status)
 
             self.status['lastupdate'] = time.time()
 
@@ -140,54 +127,14 @@ class ac_db_debug(device):
         # packet = bytearray(32)
         # 10111011 00000000 00000110 10000000 00000000 00000000 00001111 00000000 00000001 9 00000001 10 01000111 11 00101000  12 00100000 13 10100000 14 00000000 15 00100000  16 00000000 17 00000000 18 00100000 19 00000000 20 00010000 21 00000000 22 00000101 10010001 10010101
         # print "setting something"
+        ##Make sure to fix the global status as well
         if self.status['temp'] < 16:
-            temperature = 16 - 8
-            temperature_05 = 0
-
-            ##Make sure to fix the global status as well
-            self.status['temp'] = 16
-
+            self.status['temp'] = float(16)
         elif self.status['temp'] > 32:
-            temperature = 32 - 8
-            temperature_05 = 0
-            ##Make sure to fix the global status as well
-            self.status['temp'] = 32
+            self.status['temp'] = float(32)
 
-        else:
-            ##if 0.5 then make true	. Also  offset with 8
-            if self.status['temp'].is_integer():
-                temperature = int(self.status['temp'] - 8)
-                temperature_05 = 0
-            else:
-                temperature_05 = 1
-                temperature = int(self.status['temp'] - 8)
-        # print temperature
-
-        payload = bytearray(23)
-        payload[0] = 0xbb
-        payload[1] = 0x00
-        payload[2] = 0x06  # Send command, seems like 07 is response
-        payload[3] = 0x80
-        payload[4] = 0x00
-        payload[5] = 0x00
-        payload[6] = 0x0f  # Set status .. #02 -> get info?
-        payload[7] = 0x00
-        payload[8] = 0x01
-        payload[9] = 0x01
-        payload[10] = 0b00000000 | temperature << 3 | self.status['fixation_v']
-        payload[11] = 0b00000000 | self.status['fixation_h'] << 5
-        payload[
-            12] = 0b00001111 | temperature_05 << 7  # bit 1:  0.5  #bit   if 0b?1 then nothing done....  last 6 is some sort of packet_id
-        payload[13] = 0b00000000 | self.status['fanspeed'] << 5
-        payload[14] = 0b00000000 | self.status['turbo'] << 6 | self.status['mute'] << 7
-        payload[15] = 0b00000000 | self.status['mode'] << 5 | self.status['sleep'] << 2
-        payload[16] = 0b00000000
-        payload[17] = 0x00
-        payload[18] = 0b00000000 | self.status['power'] << 5 | self.status['health'] << 1 | self.status['clean'] << 2
-        payload[19] = 0x00
-        payload[20] = 0b00000000 | self.status['display'] << 4 | self.status['mildew'] << 3
-        payload[21] = 0b00000000
-        payload[22] = 0b00000000
+        # Any fraction of a degree is sent as .5
+        payload = AC_STATE_CODEC.encode(self.status)
 
         # print ("Payload:"+ ''.join(format(x, '02x') for x in payload))
 
@@ -208,10 +155,10 @@ class ac_db_debug(device):
         response = self.send_packet(0x6a, request_payload)
         self.logger.debug("Resposnse:" + ''.join(format(x, '02x') for x in response))
 
-        err = response[0x22] | (response[0x23] << 8)
+        err = FrameCodec.error_code(response)
         if err == 0:
 
-            response_payload = self.decrypt(bytes(response[0x38:]))
+            response_payload = self.decrypt(FrameCodec.payload(response))
             response_payload = bytearray(response_payload)
             packet_type = response_payload[4]
             if packet_type == 0x07:  ##Should be result packet, otherwise something weird
@@ -239,70 +186,10 @@ class ac_db_debug(device):
         return checksum
 
     def send_packet(self, command, payload):
-        self.count = (self.count + 1) & 0xffff
-        packet = bytearray(0x38)
-        packet[0x00] = 0x5a
-        packet[0x01] = 0xa5
-        packet[0x02] = 0xaa
-        packet[0x03] = 0x55
-        packet[0x04] = 0x5a
-        packet[0x05] = 0xa5
-        packet[0x06] = 0xaa
-        packet[0x07] = 0x55
-        packet[0x24] = 0x2a  # ==> Type
-        packet[0x25] = 0x4e  # ==> Type
-        packet[0x26] = command
-        packet[0x28] = self.count & 0xff
-        packet[0x29] = self.count >> 8
-        packet[0x2a] = self.mac[0]
-        packet[0x2b] = self.mac[1]
-        packet[0x2c] = self.mac[2]
-        packet[0x2d] = self.mac[3]
-        packet[0x2e] = self.mac[4]
-        packet[0x2f] = self.mac[5]
-        packet[0x30] = self.id[0]
-        packet[0x31] = self.id[1]
-        packet[0x32] = self.id[2]
-        packet[0x33] = self.id[3]
-
-        checksum = 0xbeaf
-        for i in range(len(payload)):
-            checksum += payload[i]
-            checksum = checksum & 0xffff
-
-        payload = self.encrypt(bytes(payload))
-
-        packet[0x34] = checksum & 0xff
-        packet[0x35] = checksum >> 8
-
-        for i in range(len(payload)):
-            packet.append(payload[i])
-
-        checksum = 0xbeaf
-        for i in range(len(packet)):
-            checksum += packet[i]
-            checksum = checksum & 0xffff
-        packet[0x20] = checksum & 0xff
-        packet[0x21] = checksum >> 8
+        packet = self._build_packet(command, payload)
 
         # print 'Sending Packet:\n'+''.join(format(x, '02x') for x in packet)+"\n"
-        starttime = time.time()
-
-        with self.lock:
-            while True:
-                try:
-                    self.cs.sendto(packet, self.host)
-                    self.cs.settimeout(1)
-                    response = self.cs.recvfrom(1024)
-                    # print response
-                    break
-                except socket.timeout as err:
-                    if (time.time() - starttime) < self.timeout:
-                        pass
-                    # print "timedout"
-                    print(err)
-                    raise ConnectTimeout(200, self.host)
-        return bytearray(response[0])
+        return self._run(self._async_request(packet))
 
     def auth(self):
         payload = bytearray(0x50)
@@ -333,9 +220,7 @@ class ac_db_debug(device):
 
         response = self.send_packet(0x65, payload)
 
-        enc_payload = response[0x38:]
-
-        payload = self.decrypt(bytes(enc_payload))
+        payload = self.decrypt(FrameCodec.payload(response))
 
         if not payload:
             return False
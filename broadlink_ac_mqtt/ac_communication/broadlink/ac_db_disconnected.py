@@ -18,9 +18,51 @@ class ac_db_disconnected:
     def get_ac_status(self, force_update=False):
         return None
 
+    async def async_get_ac_status(self, force_update=False):
+        return None
+
     def set_default_values(self):
         pass
 
+    def apply_changes(self, changes):
+        return None
+
+    async def async_apply_changes(self, changes):
+        return None
+
+    def temperature_changes(self, temperature):
+        return None
+
+    def power_changes(self, value):
+        return None
+
+    def mode_changes(self, mode_text):
+        return None
+
+    def fanspeed_changes(self, mode_text):
+        return None
+
+    def mute_changes(self, value):
+        return None
+
+    def turbo_changes(self, value):
+        return None
+
+    def fixation_v_changes(self, fixation_text):
+        return None
+
+    def fixation_h_changes(self, fixation_text):
+        return None
+
+    def onoff_changes(self, key, value):
+        return None
+
+    def homekit_mode_changes(self, status):
+        return None
+
+    def homeassistant_mode_changes(self, status):
+        return None
+
     def set_temperature(self, temperature):
         pass
 
@@ -72,12 +114,21 @@ class ac_db_disconnected:
     def get_ac_info(self):
         pass
 
+    async def async_get_ac_info(self):
+        pass
+
     def get_ac_states(self, force_update=False):
         pass
 
+    async def async_get_ac_states(self, force_update=False):
+        pass
+
     def make_nice_status(self, status):
         pass
 
+    def expected_nice_status(self, changes):
+        pass
+
     def get_key(self, list, search_value):
         pass
 
@@ -98,3 +149,6 @@ class ac_db_disconnected:
 
     def set_ac_status(self):
         pass
+
+    async def async_set_ac_status(self):
+        pass
@@ -0,0 +1,59 @@
+class AcStatus:
+    """Raw state of one AC as a slotted record.
+
+    Fields can be read and written as attributes or, as the status dict used to be, by key. Every change
+    of a value other than the bookkeeping fields bumps version, so views derived from the state can be
+    cached until it changes.
+    """
+
+    __slots__ = ('temp', 'fixation_v', 'power', 'mode', 'sleep', 'display', 'health', 'ifeel', 'fixation_h',
+                 'fanspeed', 'turbo', 'mute', 'clean', 'mildew', 'macaddress', 'hostip', 'lastupdate',
+                 'ambient_temp', 'devicename', 'name', 'version', '_decoded')
+
+    FIELDS = __slots__[:-2]
+    # Updated on every poll without changing the state itself
+    UNVERSIONED = frozenset(('hostip', 'lastupdate', 'name'))
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, None)
+        self.version = 0
+        self._decoded = None
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        if key not in self.UNVERSIONED and getattr(self, key) != value:
+            self.version += 1
+            self._decoded = None
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def keys(self):
+        return self.FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def update_decoded(self, names, values):
+        """Store a decoded state block, values is the tuple StateCodec.decode returns for names.
+
+        A poll that returns the same block as the previous one leaves the record and its version alone.
+        """
+        if values == self._decoded:
+            return
+        for name, value in zip(names, values):
+            setattr(self, name, value)
+        self.version += 1
+        self._decoded = values
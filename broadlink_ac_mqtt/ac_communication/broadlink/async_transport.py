@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import socket
+import threading
+
+from broadlink_ac_mqtt.ac_communication.broadlink.connect_timeout import ConnectTimeout
+from broadlink_ac_mqtt.ac_communication.broadlink.frame_codec import HEADER_SIZE, FrameCodec
+from broadlink_ac_mqtt.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class UdpMultiplexer(asyncio.DatagramProtocol):
+    """One UDP socket shared by all devices, with awaitable request/response.
+
+    Replies are routed to the waiting request by source address and the 16-bit packet
+    counter at offsets 0x28/0x29. Late or duplicate replies have no waiter and are dropped.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.dropped = 0
+        self._pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < HEADER_SIZE:
+            self.dropped += 1
+            metrics.increment('udp_datagrams_dropped')
+            logger.debug(f"Dropping short datagram from {addr}")
+            return
+
+        count = FrameCodec.count(data)
+        waiter = self._pending.pop((addr[0], addr[1], count), None)
+        if waiter is None or waiter.done():
+            self.dropped += 1
+            metrics.increment('udp_datagrams_dropped')
+            logger.debug(f"Dropping unexpected reply from {addr}, count {count}")
+            return
+        # Hand the received bytes over as is, payloads are read through memoryviews
+        waiter.set_result(data)
+
+    def error_received(self, exc):
+        # ICMP errors on an unconnected socket can't be tied to a request, those requests just time out
+        logger.debug(f"UDP error received: {exc}")
+
+    def connection_lost(self, exc):
+        self.transport = None
+        pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            if not waiter.done():
+                waiter.set_exception(exc or ConnectionError("Socket closed"))
+
+    async def request(self, packet, host, rtt, deadline):
+        """Send a packet and wait for its reply, retransmitting after every RTO until the deadline.
+
+        The same packet (and so the same count) is resent, whichever copy is answered first wins.
+        Only replies to packets sent once are used as RTT samples (Karn's algorithm).
+        """
+        loop = asyncio.get_running_loop()
+        key = (host[0], host[1], FrameCodec.count(packet))
+        waiter = loop.create_future()
+        self._pending[key] = waiter
+        try:
+            retransmitted = False
+            while True:
+                sent_at = loop.time()
+                remaining = deadline - sent_at
+                if remaining <= 0:
+                    rtt.on_timeout()
+                    raise ConnectTimeout(200, (host[0], host[1]))
+                self.transport.sendto(packet, host)
+                try:
+                    response = await asyncio.wait_for(asyncio.shield(waiter), min(rtt.rto, remaining))
+                except asyncio.TimeoutError:
+                    rtt.on_retransmit()
+                    retransmitted = True
+                    continue
+                if not retransmitted:
+                    rtt.on_sample(loop.time() - sent_at)
+                return response
+        finally:
+            if self._pending.get(key) is waiter:
+                del self._pending[key]
+            if not waiter.done():
+                waiter.cancel()
+
+
+_multiplexers = {}
+
+
+async def get_multiplexer(bind_to_ip=None):
+    """Shared UDP socket for the given local address, created on first use on the I/O loop."""
+    task = _multiplexers.get(bind_to_ip)
+    if task is None or (task.done() and (task.exception() or task.result()[0].is_closing())):
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(loop.create_datagram_endpoint(UdpMultiplexer, local_addr=(bind_to_ip or '0.0.0.0', 0)))
+        _multiplexers[bind_to_ip] = task
+    _, protocol = await task
+    return protocol
+
+
+async def resolve_host(host):
+    """Resolve a (host, port) tuple to the numeric address replies will come from."""
+    infos = await asyncio.get_running_loop().getaddrinfo(host[0], host[1], family=socket.AF_INET,
+                                                         type=socket.SOCK_DGRAM)
+    return infos[0][4]
+
+
+class EventLoopThread:
+    """Runs an asyncio event loop in a daemon thread so blocking code can submit coroutines to it."""
+
+    def __init__(self, name="broadlink-io"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block until it finishes."""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("Blocking call made from the I/O loop thread, await the async variant instead")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop without waiting, returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+_io_loop = None
+_io_loop_lock = threading.Lock()
+
+
+def get_io_loop():
+    """Shared event loop that performs all device I/O."""
+    global _io_loop
+    with _io_loop_lock:
+        if _io_loop is None:
+            _io_loop = EventLoopThread()
+        return _io_loop
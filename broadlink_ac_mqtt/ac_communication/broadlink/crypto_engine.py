@@ -0,0 +1,56 @@
+import threading
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+BLOCK_SIZE = 16
+
+
+def _xor_block(a, b):
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(BLOCK_SIZE, 'big')
+
+
+class AesCbcEngine:
+    """AES-CBC with a fixed IV whose cipher contexts, and so the key schedule, are reused across messages.
+
+    The encryptor and decryptor are never finalized. Every message must restart the chain from the IV,
+    while a running context chains from the last ciphertext block it saw, so the first block of each
+    message is corrected by XOR with (last block ^ IV): on the plaintext going in when encrypting,
+    on the plaintext coming out when decrypting. Payloads are unpadded and must be a multiple of 16 bytes.
+    """
+
+    def __init__(self, key, iv):
+        self.iv = bytes(iv)
+        cipher = Cipher(algorithms.AES(bytes(key)), modes.CBC(self.iv), backend=default_backend())
+        self._encryptor = cipher.encryptor()
+        self._decryptor = cipher.decryptor()
+        # Last ciphertext block each context chained from, XOR'ed with the IV
+        self._encrypt_fix = bytes(BLOCK_SIZE)
+        self._decrypt_fix = bytes(BLOCK_SIZE)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _check_length(payload):
+        if len(payload) % BLOCK_SIZE:
+            raise ValueError("The length of the provided data is not a multiple of the block length.")
+
+    def encrypt(self, payload):
+        self._check_length(payload)
+        if not payload:
+            return b''
+        with self._lock:
+            first = _xor_block(payload[:BLOCK_SIZE], self._encrypt_fix)
+            encrypted = self._encryptor.update(first) + self._encryptor.update(payload[BLOCK_SIZE:])
+            self._encrypt_fix = _xor_block(encrypted[-BLOCK_SIZE:], self.iv)
+        return encrypted
+
+    def decrypt(self, payload):
+        self._check_length(payload)
+        if not payload:
+            return b''
+        with self._lock:
+            decrypted = self._decryptor.update(payload)
+            fix = self._decrypt_fix
+            self._decrypt_fix = _xor_block(payload[-BLOCK_SIZE:], self.iv)
+        return _xor_block(decrypted[:BLOCK_SIZE], fix) + decrypted[BLOCK_SIZE:]
+
@@ -1,39 +1,25 @@
+import asyncio
+import logging
 import random
-import socket
-import threading
-import time
-
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-
-from broadlink_ac_mqtt.ac_communication.broadlink.connect_timeout import ConnectTimeout
-
-
-def retry_on_failure(retries=3, delay=1, backoff=2):
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            attempt = 0
-            current_delay = delay
-            while attempt < retries:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    print(f"ERROR in retry decorator: {type(e).__name__}: {e}")
-                    attempt += 1
-                    if attempt >= retries:
-                        raise
-                    time.sleep(current_delay)
-                    current_delay *= backoff
-            return None # unreachable
-        return wrapper
-    return decorator
+
+from broadlink_ac_mqtt.ac_communication.broadlink.async_transport import get_io_loop, get_multiplexer, resolve_host
+from broadlink_ac_mqtt.ac_communication.broadlink.crypto_engine import AesCbcEngine
+from broadlink_ac_mqtt.ac_communication.broadlink.frame_codec import FrameCodec
+from broadlink_ac_mqtt.ac_communication.broadlink.rtt_estimator import RttEstimator
+
+logger = logging.getLogger(__name__)
+
+# Error codes of a reply to a session the device doesn't know (anymore): authentication failed, logged out,
+# control key expired
+SESSION_ERRORS = frozenset((0xffff, 0xfffe, 0xfff9))
 
 
 class device:
     __INIT_KEY = "097628343fe99e23765c1513accf8b02"
     __INIT_VECT = "562e17996d093d28ddb3ba695a2e6f58"
 
-    def __init__(self, host, mac, timeout=10, name=None, cloud=None, devtype=None, update_interval=0, bind_to_ip=None):
+    def __init__(self, host, mac, timeout=5, name=None, cloud=None, devtype=None, update_interval=0, bind_to_ip=None,
+                 session_cache=None):
 
         self.host = host
         self.mac = mac
@@ -49,34 +35,38 @@ class device:
             [0x56, 0x2e, 0x17, 0x99, 0x6d, 0x09, 0x3d, 0x28, 0xdd, 0xb3, 0xba, 0x69, 0x5a, 0x2e, 0x6f, 0x58])
 
         self.id = bytearray([0, 0, 0, 0])
-        self.cs = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.cs.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.cs.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        # self.cs.bind(('',0))
+        # Resolved address replies come from, looked up on first request
+        self._remote = None
+        self.rtt = RttEstimator()
+        self.codec = FrameCodec(mac)
         self.type = "Unknown"
-        self.lock = threading.Lock()
         self.update_interval = update_interval
         self.bind_to_ip = bind_to_ip
+        self.session_cache = session_cache
+        # Set while the session in use hasn't been confirmed by a reply yet (cached, or device was unreachable)
+        self._session_unverified = False
+        # Bumped by every successful auth, tells a request whether the session it was sent with was replaced
+        self._session_generation = 0
+        # Held during the auth handshake, concurrent requests that find the session stale share one handshake
+        self._auth_lock = asyncio.Lock()
+        # Set during the auth handshake, the device has no usable session until it completes
+        self.authenticating = False
         self.aes = None
         self.update_aes(bytes.fromhex(self.__INIT_KEY))
 
     def update_aes(self, key: bytes) -> None:
         """Update AES."""
-        self.aes = Cipher(
-            algorithms.AES(bytes(key)), modes.CBC(self.iv), backend=default_backend()
-        )
+        self.aes = AesCbcEngine(key, self.iv)
 
     def encrypt(self, payload: bytes) -> bytes:
         """Encrypt the payload."""
-        encryptor = self.aes.encryptor()
-        return encryptor.update(bytes(payload)) + encryptor.finalize()
+        return self.aes.encrypt(payload)
 
     def decrypt(self, payload: bytes) -> bytes:
         """Decrypt the payload."""
-        decryptor = self.aes.decryptor()
-        return decryptor.update(bytes(payload)) + decryptor.finalize()
+        return self.aes.decrypt(payload)
 
-    def auth(self):
+    def _auth_payload(self):
         payload = bytearray(0x50)
         payload[0x04] = 0x31
         payload[0x05] = 0x31
@@ -102,12 +92,10 @@ class device:
         payload[0x34] = ord(' ')
         payload[0x35] = ord(' ')
         payload[0x36] = ord('1')
+        return payload
 
-        response = self.send_packet(0x65, payload)
-
-        enc_payload = response[0x38:]
-
-        payload = self.decrypt(bytes(enc_payload))
+    def _apply_auth_response(self, response):
+        payload = self.decrypt(FrameCodec.payload(response))
 
         if not payload:
             return False
@@ -121,72 +109,114 @@ class device:
 
         self.update_aes(payload[0x04:0x14])
 
+        if self.session_cache is not None:
+            self.session_cache.put(self.mac, self.id, self.key)
+        self._session_unverified = False
+        self._session_generation += 1
+
+        return True
+
+    def auth(self):
+        return self._run(self.async_auth())
+
+    async def async_auth(self):
+        async with self._auth_lock:
+            return await self._async_auth()
+
+    async def _async_auth(self):
+        # The handshake always uses the initial key and a blank id, even when replacing a stale session
+        self.authenticating = True
+        try:
+            self.id = bytearray([0, 0, 0, 0])
+            self.update_aes(bytes.fromhex(self.__INIT_KEY))
+            response = await self.async_send_packet(0x65, self._auth_payload())
+            return self._apply_auth_response(response)
+        finally:
+            self.authenticating = False
+
+    def login(self):
+        return self._run(self.async_login())
+
+    async def async_login(self):
+        """Resume the cached session of this device if there is one, otherwise authenticate."""
+        session = self.session_cache.get(self.mac) if self.session_cache is not None else None
+        if session is None:
+            return await self.async_auth()
+
+        self.id, self.key = session
+        self.update_aes(self.key)
+        self._session_unverified = True
+        logger.debug(f"Using cached session for {self.host}")
         return True
 
+    def _session_accepted(self, response):
+        # A stale session shows up as an error code, or as a reply that doesn't decrypt to a sane length. Any
+        # error rejects a session that was never confirmed, a confirmed one only the session errors
+        error = FrameCodec.error_code(response)
+        if error in SESSION_ERRORS or (error and self._session_unverified):
+            return False
+        if error:
+            return True
+        payload = self.decrypt(FrameCodec.payload(response))
+        length = payload[0] | (payload[1] << 8) if len(payload) >= 2 else 0
+        return 0 < length <= len(payload) - 2
+
     def get_type(self):
         return self.type
 
-    @retry_on_failure(retries=3, delay=1, backoff=2)
-    def send_packet(self, command, payload):
+    def _build_packet(self, command, payload):
         self.count = (self.count + 1) & 0xffff
-        packet = bytearray(0x38)
-        packet[0x00] = 0x5a
-        packet[0x01] = 0xa5
-        packet[0x02] = 0xaa
-        packet[0x03] = 0x55
-        packet[0x04] = 0x5a
-        packet[0x05] = 0xa5
-        packet[0x06] = 0xaa
-        packet[0x07] = 0x55
-        packet[0x24] = 0x2a  # ==> Type
-        packet[0x25] = 0x4e  # ==> Type
-        packet[0x26] = command
-        packet[0x28] = self.count & 0xff
-        packet[0x29] = self.count >> 8
-        packet[0x2a] = self.mac[0]
-        packet[0x2b] = self.mac[1]
-        packet[0x2c] = self.mac[2]
-        packet[0x2d] = self.mac[3]
-        packet[0x2e] = self.mac[4]
-        packet[0x2f] = self.mac[5]
-        packet[0x30] = self.id[0]
-        packet[0x31] = self.id[1]
-        packet[0x32] = self.id[2]
-        packet[0x33] = self.id[3]
-
-        checksum = 0xbeaf
-        for i in range(len(payload)):
-            checksum += payload[i]
-            checksum = checksum & 0xffff
-
-        payload = self.encrypt(bytes(payload))
-
-        packet[0x34] = checksum & 0xff
-        packet[0x35] = checksum >> 8
-
-        for i in range(len(payload)):
-            packet.append(payload[i])
-
-        checksum = 0xbeaf
-        for i in range(len(packet)):
-            checksum += packet[i]
-            checksum = checksum & 0xffff
-        packet[0x20] = checksum & 0xff
-        packet[0x21] = checksum >> 8
-
-        # print 'Sending Packet:\n'+''.join(format(x, '02x') for x in packet)+"\n"
-        starttime = time.time()
-        with self.lock:
-            while True:
-                try:
-                    self.cs.sendto(packet, self.host)
-                    self.cs.settimeout(1)
-                    response = self.cs.recvfrom(1024)
-
-                    break
-                except socket.timeout as err:
-                    if (time.time() - starttime) < self.timeout:
-                        pass
-                    print(err)
-                    raise ConnectTimeout(200, (self.host[0], self.host[1]))
-        return bytearray(response[0])
+        return self.codec.encode(command, self.count, self.id, payload, self.encrypt)
+
+    def _run(self, coro):
+        """Blocking entry point, runs an async variant on the shared I/O loop."""
+        return get_io_loop().run(coro)
+
+    def send_packet(self, command, payload):
+        return self._run(self.async_send_packet(command, payload))
+
+    async def async_send_packet(self, command, payload, timeout=None):
+        if command == 0x65:
+            return await self._async_request(self._build_packet(command, payload), timeout)
+
+        if self._auth_lock.locked():
+            # Sent with the session the handshake in progress replaces, it would only be rejected
+            async with self._auth_lock:
+                pass
+
+        generation = self._session_generation
+        response = await self._async_request(self._build_packet(command, payload), timeout)
+
+        # Any reply can show the session is gone, the device may have rebooted or expired it. A reply to a
+        # session replaced meanwhile can't be checked with the new key, it is simply sent again
+        if generation == self._session_generation and self._session_accepted(response):
+            self._session_unverified = False
+        elif await self._async_reauth(generation):
+            response = await self._async_request(self._build_packet(command, payload), timeout)
+
+        return response
+
+    async def _async_reauth(self, generation):
+        """Replace the session a request was sent with, once for all requests that found it stale."""
+        async with self._auth_lock:
+            if generation != self._session_generation:
+                # Another request authenticated while this one waited
+                return True
+            logger.info(f"Session rejected by {self.host}, authenticating")
+            if self.session_cache is not None:
+                self.session_cache.invalidate(self.mac)
+            # The session stays unverified if this fails, so the next request tries again
+            return await self._async_auth()
+
+    async def _async_request(self, packet, timeout=None):
+        # All devices share one socket, replies are matched on address and packet count.
+        # Lost packets are resent after the adaptive RTO, giving up after self.timeout seconds.
+        deadline = asyncio.get_running_loop().time() + (timeout or self.timeout)
+        if self._remote is None:
+            self._remote = await resolve_host(self.host)
+        multiplexer = await get_multiplexer(self.bind_to_ip)
+        return await multiplexer.request(packet, self._remote, self.rtt, deadline)
+
+    def rtt_stats(self):
+        """Round trip time statistics of this device, in seconds."""
+        return self.rtt.stats()
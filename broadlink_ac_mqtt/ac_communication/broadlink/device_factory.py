@@ -4,12 +4,15 @@ from broadlink_ac_mqtt.ac_communication.broadlink.ac_db_disconnected import ac_d
 from broadlink_ac_mqtt.ac_communication.broadlink.device import device
 
 
-def create_device(dev_type, host, mac, name=None, cloud=None, update_interval=0):
+def create_device(dev_type, host, mac, name=None, cloud=None, update_interval=0, session_cache=None,
+                  info_interval=60, state_interval=0, state_max_age=10, connect=True):
     # print format(dev_type,'02x')
     match dev_type:
         # We only care about 1 device type...
         case 0x4E2a:  # Danham Bush
-            return ac_db(host=host, mac=mac, name=name, cloud=cloud, devtype=dev_type, update_interval=0)
+            return ac_db(host=host, mac=mac, name=name, cloud=cloud, devtype=dev_type, update_interval=0,
+                         session_cache=session_cache, info_interval=info_interval, state_interval=state_interval,
+                         state_max_age=state_max_age, connect=connect)
         case 0xFFFFFFF:  # test
             return ac_db_debug(host=host, mac=mac, name=name, cloud=cloud, devtype=dev_type, update_interval=0)
         case 0x0000000:
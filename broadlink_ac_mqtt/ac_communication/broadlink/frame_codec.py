@@ -0,0 +1,51 @@
+import struct
+
+HEADER_SIZE = 0x38
+
+_MAGIC = b'\x5a\xa5\xaa\x55\x5a\xa5\xaa\x55'
+_UINT16 = struct.Struct('<H')
+# command at 0x26, count at 0x28, session id at 0x30, payload checksum at 0x34
+_COMMAND_COUNT = struct.Struct('<BxH')
+_ID_CHECKSUM = struct.Struct('<4sH')
+
+
+class FrameCodec:
+    """Encodes and decodes the frames of one device.
+
+    The 0x38 byte header is prepared once with the magic, device type and MAC, so encoding a
+    frame only patches command, count, session id and the two checksums into a copy of it.
+    Checksums are summed over whole buffers instead of byte by byte.
+    """
+
+    def __init__(self, mac, devtype=0x4e2a):
+        template = bytearray(HEADER_SIZE)
+        template[0x00:0x08] = _MAGIC
+        _UINT16.pack_into(template, 0x24, devtype)
+        template[0x2a:0x30] = bytes(mac[0:6])
+        self._template = bytes(template)
+
+    def encode(self, command, count, session_id, payload, encrypt):
+        """Build a complete frame, encrypt is called with the plain payload."""
+        payload_checksum = (0xbeaf + sum(payload)) & 0xffff
+        encrypted = encrypt(payload)
+
+        packet = bytearray(HEADER_SIZE + len(encrypted))
+        packet[0:HEADER_SIZE] = self._template
+        packet[HEADER_SIZE:] = encrypted
+        _COMMAND_COUNT.pack_into(packet, 0x26, command, count)
+        _ID_CHECKSUM.pack_into(packet, 0x30, bytes(session_id[0:4]), payload_checksum)
+        _UINT16.pack_into(packet, 0x20, (0xbeaf + sum(packet)) & 0xffff)
+        return packet
+
+    @staticmethod
+    def count(frame):
+        return frame[0x28] | (frame[0x29] << 8)
+
+    @staticmethod
+    def error_code(frame):
+        return frame[0x22] | (frame[0x23] << 8)
+
+    @staticmethod
+    def payload(frame):
+        """Encrypted payload of a received frame, as a view without copying."""
+        return memoryview(frame)[HEADER_SIZE:]
@@ -0,0 +1,50 @@
+class RttEstimator:
+    """Smoothed round trip time and retransmission timeout of one device, as TCP does it (RFC 6298)."""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_rto=1.0, min_rto=0.05, max_rto=4.0):
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.last_rtt = None
+        self.samples = 0
+        self.retransmissions = 0
+        self.timeouts = 0
+
+    def on_sample(self, rtt):
+        """Feed the round trip time of a request that was answered without retransmission."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.last_rtt = rtt
+        self.samples += 1
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + self.K * self.rttvar))
+
+    def on_retransmit(self):
+        """Back off the timer after a request went unanswered for a full RTO."""
+        self.retransmissions += 1
+        self.rto = min(self.max_rto, self.rto * 2)
+
+    def on_timeout(self):
+        """Record a request that ran into its deadline."""
+        self.timeouts += 1
+
+    def stats(self):
+        return {
+            'srtt': self.srtt,
+            'rttvar': self.rttvar,
+            'rto': self.rto,
+            'last_rtt': self.last_rtt,
+            'samples': self.samples,
+            'retransmissions': self.retransmissions,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCache:
+    """On-disk store of the session id and AES key negotiated with each device, keyed by MAC."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sessions = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding='UTF8') as cache_file:
+                return json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable session cache {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        # Write to a temp file and swap it in, so a crash never leaves a truncated cache behind
+        tmp_path = self.path + ".tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding='UTF8') as cache_file:
+                json.dump(self._sessions, cache_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write session cache {self.path}: {e}")
+
+    @staticmethod
+    def _mac_key(mac):
+        return ''.join(format(x, '02x') for x in mac)
+
+    def get(self, mac):
+        """Return (id, key) of the cached session or None."""
+        with self._lock:
+            session = self._sessions.get(self._mac_key(mac))
+        if not session:
+            return None
+        return bytearray.fromhex(session['id']), bytearray.fromhex(session['key'])
+
+    def put(self, mac, session_id, key):
+        with self._lock:
+            self._sessions[self._mac_key(mac)] = {'id': bytes(session_id).hex(), 'key': bytes(key).hex()}
+            self._save()
+
+    def invalidate(self, mac):
+        with self._lock:
+            if self._sessions.pop(self._mac_key(mac), None) is not None:
+                self._save()
@@ -0,0 +1,104 @@
+from collections import namedtuple
+
+# A bitfield of the 23 byte state block, offsets are counted after the 2 byte length prefix.
+# value = raw * scale + bias. Parts sharing a name are added up, the temperature is stored as whole
+# degrees minus 8 plus a separate half degree bit.
+StateField = namedtuple('StateField', 'name offset shift width scale bias writable', defaults=(1, 0, True))
+
+AC_STATE_FIELDS = (
+    StateField('temp', 10, 3, 5, bias=8),
+    StateField('temp', 12, 7, 1, scale=0.5),
+    StateField('fixation_v', 10, 0, 3),
+    StateField('fixation_h', 11, 5, 3),
+    StateField('fanspeed', 13, 5, 3),
+    StateField('turbo', 14, 6, 1),
+    StateField('mute', 14, 7, 1),
+    StateField('mode', 15, 5, 3),
+    StateField('sleep', 15, 2, 1),
+    StateField('ifeel', 15, 3, 1, writable=False),
+    StateField('power', 18, 5, 1),
+    StateField('health', 18, 1, 1),
+    StateField('clean', 18, 2, 1),
+    StateField('display', 20, 4, 1),
+    StateField('mildew', 20, 3, 1),
+)
+
+# Fixed bytes of a set_ac_status request: command header, and bit 0-3 of byte 12 which must be set
+AC_SET_TEMPLATE = bytes([0xbb, 0x00, 0x06, 0x80, 0x00, 0x00, 0x0f, 0x00, 0x01, 0x01,
+                         0x00, 0x00, 0x0f, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
+
+
+class StateCodec:
+    """Decodes and encodes a state block from a declarative field table.
+
+    The table is compiled once into straight-line Python functions, so a decode or encode is one
+    function call without any per-field loop or lookup.
+    """
+
+    def __init__(self, fields, template):
+        self.fields = tuple(fields)
+        self.template = bytes(template)
+        self.names = tuple(dict.fromkeys(field.name for field in self.fields))
+        self.writable_names = tuple(dict.fromkeys(field.name for field in self.fields if field.writable))
+        self.size = max(field.offset for field in self.fields) + 1
+
+        namespace = {}
+        exec(self._decode_source() + self._encode_source(), namespace)
+        self.decode = namespace['decode']
+        self.decode_into = namespace['decode_into']
+        self.encode = namespace['encode']
+
+    def _parts(self, name):
+        return [field for field in self.fields if field.name == name]
+
+    def _value_expression(self, name):
+        terms = []
+        bias = 0
+        for field in self._parts(name):
+            raw = f"(b{field.offset} >> {field.shift} & {(1 << field.width) - 1})"
+            terms.append(raw if field.scale == 1 else f"{raw} * {field.scale!r}")
+            bias += field.bias
+        if bias:
+            terms.append(repr(bias))
+        return " + ".join(terms)
+
+    def _decode_source(self):
+        # Each byte is read from the buffer once into a local
+        offsets = sorted({field.offset for field in self.fields})
+        loads = "".join(f"    b{offset} = b[{offset}]\n" for offset in offsets)
+        values = ",\n        ".join(self._value_expression(name) for name in self.names)
+        assignments = "\n".join(f"    status[{name!r}] = {self._value_expression(name)}" for name in self.names)
+        return (f"def decode(b):\n{loads}    return (\n        {values},\n    )\n\n"
+                f"def decode_into(b, status):\n{loads}{assignments}\n\n")
+
+    def _encode_source(self):
+        lines = []
+        byte_terms = {}
+        for name in self.writable_names:
+            parts = sorted(self._parts(name), key=lambda field: -field.scale)
+            if len(parts) == 1 and parts[0].scale == 1 and parts[0].bias == 0:
+                raws = {parts[0]: f"status[{name!r}]"}
+            else:
+                # Whole parts are truncated, any remainder rounds up into the finest part
+                lines.append(f"    r = status[{name!r}] - {sum(part.bias for part in parts)!r}")
+                raws = {}
+                for index, part in enumerate(parts):
+                    var = f"{name}_{index}"
+                    if index < len(parts) - 1:
+                        lines.append(f"    {var} = int(r // {part.scale!r})")
+                        lines.append(f"    r -= {var} * {part.scale!r}")
+                    else:
+                        lines.append(f"    {var} = -int(-r // {part.scale!r})")
+                    raws[part] = var
+            for part, raw in raws.items():
+                byte_terms.setdefault(part.offset, []).append(
+                    f"(({raw}) & {(1 << part.width) - 1}) << {part.shift}")
+
+        lines.append(f"    b = bytearray({self.template!r})")
+        for offset, terms in sorted(byte_terms.items()):
+            lines.append(f"    b[{offset}] |= " + " | ".join(terms))
+        lines.append("    return b")
+        return "def encode(status):\n" + "\n".join(lines) + "\n"
+
+
+AC_STATE_CODEC = StateCodec(AC_STATE_FIELDS, AC_SET_TEMPLATE)
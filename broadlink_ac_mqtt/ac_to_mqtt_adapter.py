@@ -1,11 +1,12 @@
 #!/usr/bin/python
+import asyncio
+import functools
 import json
 import logging
 import os
 import sys
 import time
 import traceback
-import threading
 
 import paho.mqtt.client as mqtt
 import yaml
@@ -13,6 +14,16 @@ import yaml
 import broadlink_ac_mqtt.ac_communication.broadlink.discovery
 import broadlink_ac_mqtt.ac_communication.broadlink.version
 from broadlink_ac_mqtt.ac_communication.broadlink import device_factory
+from broadlink_ac_mqtt.ac_communication.broadlink.async_transport import get_io_loop
+from broadlink_ac_mqtt.ac_communication.broadlink.session_cache import SessionCache
+from broadlink_ac_mqtt.circuit_breaker import CircuitBreaker
+from broadlink_ac_mqtt.command_queue import CommandQueue, PollPreempted
+from broadlink_ac_mqtt.commands import COMMANDS, compile_topic_pattern
+from broadlink_ac_mqtt.metrics import metrics
+from broadlink_ac_mqtt.poll_policy import PollPolicy
+from broadlink_ac_mqtt.publish_queue import PublishQueue
+from broadlink_ac_mqtt.scheduler import DeadlineScheduler
+from broadlink_ac_mqtt.topics import DeviceTopics, encode_payload
 
 sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'ac_communication', 'broadlink'))
 
@@ -22,12 +33,32 @@ logger = logging.getLogger(__name__)
 class AcToMqtt:
     previous_status = {}
     last_update = {}
+    # When all values of a device were last published, unchanged ones included
+    last_full_publish = {}
+    # A device with an update interval of 0 is polled back to back, but no faster than this
+    MIN_POLL_INTERVAL = 0.5
 
     def __init__(self, config):
         self.device_objects = None
         self.config = config
+        # Sessions survive restarts and reconnections so devices don't need a new auth handshake
+        self.session_cache = SessionCache(config['session_cache']) if config.get('session_cache') else None
         self._mqtt: mqtt.Client = None
-        self.start_monitoring()
+        self.publish_queue: PublishQueue = None
+        self.device_topics = {}
+        self.circuit_breakers = {}
+        # Next poll of every device
+        self.scheduler = DeadlineScheduler()
+        self.poll_policies = {}
+        # Per device, and the semaphore bounding how many execute at once. Only used on the I/O loop
+        self.command_queues = {}
+        self.command_workers = None
+        # Devices built without I/O that still need to authenticate, and the semaphore bounding how many do at once
+        self.pending_connect = set()
+        self.connect_workers = None
+        # Topic of the commands, <prefix><mac>/<command>/set
+        self.command_topic = compile_topic_pattern(config.get('mqtt_topic_prefix', ''))
+        self.last_metrics_publish = 0
 
     def test(self, config):
 
@@ -70,19 +101,28 @@ class AcToMqtt:
             logger.error(error_msg)
             sys.exit()
 
+        # Nothing is sent yet, devices authenticate concurrently on their first poll
         for device in device_list:
-            new_device = self.device_config_to_device_object(device)
+            new_device = self.device_config_to_device_object(device, connect=False)
             device_objects[device['mac']] = new_device
+            self.pending_connect.add(device['mac'])
 
         return device_objects
 
-    def device_config_to_device_object(self, device_config):
+    def device_config_to_device_object(self, device_config, connect=True):
         try:
             new_device = device_factory.create_device(dev_type=0x4E2a,
                                                       host=(device_config['ip'], device_config['port']),
                                                       mac=bytearray.fromhex(device_config['mac']),
                                                       name=device_config['name'],
-                                                      update_interval=self.config['update_interval'])
+                                                      update_interval=self.config['update_interval'],
+                                                      session_cache=self.session_cache,
+                                                      info_interval=self.info_interval(device_config),
+                                                      # With a poll policy every poll reads the state
+                                                      state_interval=0 if device_config.get('poll') else
+                                                      self.state_interval(device_config),
+                                                      state_max_age=self.state_max_age(device_config),
+                                                      connect=connect)
         except Exception as e:
             logger.error(f"Failed to create device object from config: {device_config}")
             new_device = None
@@ -118,42 +158,27 @@ class AcToMqtt:
 
         # we are alive # Update PID file
         try:
-
             for key in devices:
+                if key not in self.scheduler:
+                    self.scheduler.schedule(key, 0)
+                    self.topics(key)
 
-                device = devices[key]
-                # Just check status on every update interval
-                if key in self.last_update:
-                    logger.debug(f"Checking {key} for timeout")
-                    if (self.last_update[key] + self.config["update_interval"]) > time.time():
-                        logger.debug(
-                            f"Timeout {self.config['update_interval']} not done, so lets wait a bit : "
-                            f"{self.last_update[key] + self.config['update_interval']} : {time.time()}")
-                        time.sleep(0.5)
-                        continue
-                    else:
-                        ""
-                # print "timeout done"
+            # Periods are counted from the start of a poll, so they don't drift by its duration
+            started = self.scheduler.clock()
+            due_devices, probe_devices = self._pop_due_devices(devices)
+            results = self._rebuild_unconnected(devices, due_devices, probe_devices)
 
-                # Get the status, the global update interval is used as well to reduce requests to aircons as they slow
+            if not due_devices and not probe_devices and not results:
+                self.publish_metrics()
+                return 1
 
-                status = None
-                try:
-                    status = device.get_ac_status()
-                except Exception as e:
-                    logger.warning(f"Device {key} - failed to retrieve status. considering as disconnected")
-                    device = self.device_config_to_device_object(device.original_config)
-                    devices[key] = device
-                    status = None
+            # Get the status of all due devices concurrently, a cycle takes as long as the slowest device
+            results.update(get_io_loop().run(self._poll_devices(due_devices, probe_devices)))
 
-                # print status
-                if status:
-                    # Update last time checked
-                    self.last_update[key] = time.time()
-                    self.publish_mqtt_info(status)
+            for key, status in results.items():
+                self._handle_poll_result(key, devices[key], status, started)
 
-                else:
-                    logger.debug("No status")
+            self.publish_metrics()
 
         except Exception as e:
             logger.critical(e)
@@ -162,6 +187,173 @@ class AcToMqtt:
 
         return 1
 
+    def _pop_due_devices(self, devices):
+        """Devices due for a poll and devices due for a probe, the others due are scheduled again."""
+        due_devices = {}
+        probe_devices = {}
+        for key in self.scheduler.pop_due():
+            if key not in devices:
+                continue
+            # An unreachable device costs nothing until its circuit breaker lets a probe through
+            breaker = self.circuit_breaker(key)
+            if not breaker.allow_request():
+                self.scheduler.schedule(key, breaker.retry_at - breaker.clock())
+            elif breaker.state == CircuitBreaker.HALF_OPEN:
+                probe_devices[key] = devices[key]
+            elif not self._postpone_refreshed(key, devices[key]):
+                due_devices[key] = devices[key]
+        return due_devices, probe_devices
+
+    def _postpone_refreshed(self, key, device):
+        # A command whose reply carried the state counts as a poll as well
+        refreshed = self.device_lastupdate(device)
+        next_poll = refreshed + self.poll_interval(key, device)
+        if key in self.last_update and refreshed > self.last_update[key] and next_poll > time.time():
+            logger.debug(f"Device {key} - state refreshed by a command, postponing poll")
+            self.scheduler.schedule(key, next_poll - time.time())
+            return True
+        return False
+
+    def _rebuild_unconnected(self, devices, due_devices, probe_devices):
+        """Results of the probes that can't be sent.
+
+        Devices that never connected can only be probed by building them again, without I/O here. They move to
+        due_devices, whose poll connects them like at startup.
+        """
+        results = {}
+        for key in [key for key, device in probe_devices.items() if not hasattr(device, 'async_probe')]:
+            del probe_devices[key]
+            devices[key] = self.device_config_to_device_object(devices[key].original_config, connect=False)
+            if hasattr(devices[key], 'async_probe'):
+                self.pending_connect.add(key)
+                due_devices[key] = devices[key]
+            else:
+                results[key] = ConnectionError("Device not connected")
+        return results
+
+    def _handle_poll_result(self, key, device, status, started):
+        if isinstance(status, PollPreempted):
+            # The reply to the command refreshes the state, the poll that was due is dropped
+            logger.debug(status)
+            self.scheduler.schedule(key, self.poll_interval(key, device))
+            return
+        # No status (failed auth, an error reply, ...) is as much a failure as an exception
+        if isinstance(status, Exception) or not status:
+            logger.warning(f"Device {key} - failed to retrieve status. considering as disconnected")
+            breaker = self.circuit_breaker(key)
+            breaker.record_failure()
+            self.scheduler.schedule(key, breaker.retry_at - breaker.clock())
+            return
+        self.circuit_breaker(key).record_success()
+        self.pending_connect.discard(key)
+        policy = self.poll_policy(key, device)
+        if policy:
+            policy.observe(status)
+        if key in self.last_update:
+            self.scheduler.schedule_at(key, started + self.poll_interval(key, device))
+        else:
+            # After the first poll the fleet's polls are spread over their interval
+            self.scheduler.schedule_spread(key, self.poll_interval(key, device))
+
+        # Update last time checked, the status was published by _poll_device already
+        self.last_update[key] = time.time()
+
+    def poll_interval(self, key, device):
+        """Seconds until the next poll of a device.
+
+        Set by its poll policy if it has one, otherwise whichever of its state and info intervals comes first.
+        """
+        policy = self.poll_policy(key, device)
+        if policy:
+            interval = policy.interval
+        else:
+            interval = min(self.state_interval(device.original_config), self.info_interval(device.original_config))
+        metrics.set_gauge('poll_interval', interval, device=key)
+        return max(self.MIN_POLL_INTERVAL, interval)
+
+    def poll_policy(self, key, device):
+        """Adaptive poll policy from the poll section of the device config, None if it has none."""
+        if key not in self.poll_policies:
+            self.poll_policies[key] = PollPolicy.from_config((device.original_config or {}).get('poll'))
+        return self.poll_policies[key]
+
+    def wait_for_next_poll(self, timeout=None):
+        """Sleep until the next device is due for a poll."""
+        self.scheduler.wait(timeout)
+
+    def state_interval(self, device_config):
+        """Seconds between state (mode, setpoint, ...) queries of a device, defaults to update_interval."""
+        return (device_config or {}).get('state_interval', self.config['update_interval'])
+
+    def info_interval(self, device_config):
+        """Seconds between ambient temperature queries of a device."""
+        return (device_config or {}).get('info_interval', self.config.get('info_interval', 60))
+
+    def state_max_age(self, device_config):
+        """Seconds a read state is trusted by setters before they read it again."""
+        return (device_config or {}).get('state_max_age', self.config.get('state_max_age', 10))
+
+    @staticmethod
+    def device_lastupdate(device):
+        """When the device last read its state, 0 for devices without one."""
+        status = getattr(device, 'status', None)
+        return (status['lastupdate'] if status is not None else None) or 0
+
+    def circuit_breaker(self, key):
+        if key not in self.circuit_breakers:
+            self.circuit_breakers[key] = CircuitBreaker(key)
+        return self.circuit_breakers[key]
+
+    async def _poll_devices(self, devices, probe_devices):
+        polls = {}
+        for key, device in devices.items():
+            if key in self.pending_connect:
+                polls[key] = self._poll_device(key, device, functools.partial(self._connect_device, key, device))
+            else:
+                polls[key] = self._poll_device(key, device, device.async_get_ac_status)
+        for key, device in probe_devices.items():
+            polls[key] = self._poll_device(key, device, device.async_probe)
+        results = await asyncio.gather(*polls.values(), return_exceptions=True)
+        return dict(zip(polls, results))
+
+    async def _poll_device(self, key, device, call):
+        # Polls go through the command queue of the device, so commands for it take precedence
+        status = await self.command_queue(key).poll(device, call)
+        # Published as soon as it is in instead of when the slowest device of the round is done. A publishing
+        # problem isn't the device's, it mustn't count against its circuit breaker
+        if status:
+            try:
+                self.publish_mqtt_info(status)
+            except Exception as e:
+                logger.critical(e)
+        return status
+
+    async def _connect_device(self, key, device):
+        # Authentication and the first status of a device, only so many devices do it at once
+        if self.connect_workers is None:
+            self.connect_workers = asyncio.Semaphore(self.config.get('connect_workers', 8))
+        async with self.connect_workers:
+            # A command may have connected it while this waited
+            if key not in self.pending_connect:
+                return device.make_nice_status(device.status)
+            status = await device.async_connect()
+        if status:
+            self.pending_connect.discard(key)
+        return status
+
+    def publish_metrics(self, force_update=False):
+        # Bridge metrics are published as one JSON document every metrics_interval seconds
+        if not force_update and self.last_metrics_publish + self.config.get('metrics_interval', 60) > time.time():
+            return
+        self.last_metrics_publish = time.time()
+        # Round trip time statistics of every device, as gauges rtt_srtt, rtt_rto, rtt_retransmissions, ...
+        for key, device in (self.device_objects or {}).items():
+            if hasattr(device, 'rtt_stats'):
+                for name, value in device.rtt_stats().items():
+                    metrics.set_gauge('rtt_' + name, value, device=key)
+        if self._mqtt:
+            self._publish(self.config["mqtt_topic_prefix"] + "bridge/metrics", json.dumps(metrics.snapshot()))
+
     def dump_homeassistant_config_from_devices(self, devices):
 
         if devices == {}:
@@ -195,29 +387,21 @@ class AcToMqtt:
             else:
                 name = device.name.encode('ascii', 'ignore')
 
+            topics = self.topics(device.status["macaddress"])
             device_array = {
                 "name": str(name.decode("utf-8"))
-                , "power_command_topic": self.config["mqtt_topic_prefix"] + device.status["macaddress"] + "/power/set"
-                , "mode_command_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/mode_homeassistant/set"
-                , "temperature_command_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/temp/set"
-                , "fan_mode_command_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/fanspeed_homeassistant/set"
-                , "swing_mode_command_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/fixation_v/set"
-                , "action_topic": self.config["mqtt_topic_prefix"] + device.status["macaddress"] + "/homeassistant/set"
+                , "power_command_topic": topics.set["power"]
+                , "mode_command_topic": topics.set["mode_homeassistant"]
+                , "temperature_command_topic": topics.set["temp"]
+                , "fan_mode_command_topic": topics.set["fanspeed_homeassistant"]
+                , "swing_mode_command_topic": topics.set["fixation_v"]
+                , "action_topic": topics.set["homeassistant"]
                 # Read values
-                , "current_temperature_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/ambient_temp/value"
-                , "mode_state_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/mode_homeassistant/value"
-                , "temperature_state_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/temp/value"
-                , "fan_mode_state_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/fanspeed_homeassistant/value"
-                , "swing_mode_state_topic": self.config["mqtt_topic_prefix"] + device.status[
-                    "macaddress"] + "/fixation_v/value"
+                , "current_temperature_topic": topics.value["ambient_temp"]
+                , "mode_state_topic": topics.value["mode_homeassistant"]
+                , "temperature_state_topic": topics.value["temp"]
+                , "fan_mode_state_topic": topics.value["fanspeed_homeassistant"]
+                , "swing_mode_state_topic": topics.value["fixation_v"]
                 , "fan_modes": ["Auto", "Low", "Medium", "High", "Turbo", "Mute"]
                 , "modes": ["off", "cool", "heat", "fan_only", "dry"]
                 , "swing_modes": ["TOP", "MIDDLE1", "MIDDLE2", "MIDDLE3", "BOTTOM", "SWING", "AUTO"]
@@ -233,6 +417,17 @@ class AcToMqtt:
                 , "availability_topic": self.config["mqtt_topic_prefix"] + "LWT"
             }
 
+            if self.config.get("mqtt_json_state"):
+                # Everything is read from the one JSON document of the device
+                state_topic = topics.state
+                for field, template_key in (("ambient_temp", "current_temperature"),
+                                            ("mode_homeassistant", "mode_state"),
+                                            ("temp", "temperature_state"),
+                                            ("fanspeed_homeassistant", "fan_mode_state"),
+                                            ("fixation_v", "swing_mode_state")):
+                    device_array[template_key + "_topic"] = state_topic
+                    device_array[template_key + "_template"] = "{{ value_json." + field + " }}"
+
             devices_array[device.status["macaddress"]] = device_array
 
         return devices_array
@@ -261,19 +456,56 @@ class AcToMqtt:
         # Loop da loop all devices and publish discovery settings
         for key in devices_array:
             device = devices_array[key]
-            topic = self.config["mqtt_auto_discovery_topic"] + "/climate/" + key + "/config"
             # Publish
-            self._publish(topic, json.dumps(device), retain=retain)
+            self._publish(self.topics(key).discovery, json.dumps(device), retain=retain)
+
+    def topics(self, address):
+        """Topic table of a device, built when it is first scheduled or published."""
+        topics = self.device_topics.get(address)
+        if topics is None:
+            topics = self.device_topics[address] = DeviceTopics(self.config["mqtt_topic_prefix"], address,
+                                                                self.config.get("mqtt_auto_discovery_topic"))
+        return topics
+
+    def birth_topic(self):
+        """Topic of the Home Assistant birth message, None without auto discovery."""
+        if not self.config.get("mqtt_auto_discovery_topic"):
+            return None
+        return self.config["mqtt_auto_discovery_topic"] + "/status"
+
+    async def async_publish_all(self):
+        """Publish the discovery config and every value of every device, changed or not.
+
+        Runs on the I/O loop like all other status publishing, the change detection state isn't shared across threads.
+        """
+        if not self.device_objects:
+            return
+        if self.config.get("mqtt_auto_discovery_topic"):
+            self.publish_mqtt_auto_discovery(self.device_objects)
+        for device in list(self.device_objects.values()):
+            # Devices that never reported a state have nothing worth publishing yet
+            if self.device_lastupdate(device):
+                self.publish_mqtt_info(device.make_nice_status(device.status), force_update=True)
 
     def publish_mqtt_info(self, status, force_update=False):
-        # If auto discovery is used, then always update
-        if not force_update:
-            force_update = True if "mqtt_auto_discovery_topic" in self.config and self.config[
-                "mqtt_auto_discovery_topic"] else False
-
-        logger.debug("Force update is: " + str(force_update))
+        # Unchanged values are only published again every heartbeat interval
+        heartbeat_interval = self.config.get("mqtt_heartbeat_interval", 300)
+        if heartbeat_interval and self.last_full_publish.get(status['macaddress'], 0) + heartbeat_interval <= time.time():
+            force_update = True
+        if force_update:
+            self.last_full_publish[status['macaddress']] = time.time()
+
+        logger.debug("Force update is: %s", force_update)
+
+        # One JSON document with all values instead of a topic per value
+        if self.config.get("mqtt_json_state"):
+            if force_update or self.previous_status.get(status['macaddress']) != status:
+                self._publish(self.topics(status['macaddress']).state, json.dumps(status))
+            self.previous_status[status['macaddress']] = status
+            return
 
         # Publish all values in status
+        value_topics = self.topics(status['macaddress']).value
         for key in status:
             # Make sure it's a string
             value = status[key]
@@ -291,15 +523,8 @@ class AcToMqtt:
                         ""
             # print ("value NOT Same key:%s, value:%s vs : %s" %  (key,value,self.previous_status[status['macaddress']][key]))
 
-            pubResult = self._publish(self.config["mqtt_topic_prefix"] + status['macaddress'] + '/' + key + '/value',
-                                      value)
-
-            if pubResult != None:
-                logger.warning(f'Publishing Result: "{mqtt.error_string(pubResult)}"')
-                if pubResult == mqtt.MQTT_ERR_NO_CONN:
-                    self.connect_mqtt()
-
-                break
+            self._publish(value_topics[key], encode_payload(value), flush=False)
+        self.publish_queue.flush()
 
         # Set previous to current
         self.previous_status[status['macaddress']] = status
@@ -308,15 +533,13 @@ class AcToMqtt:
 
     # self._publish(binascii.hexlify(status['macaddress'])+'/'+ 'temp/value',status['temp']);
 
-    def _publish(self, topic, value, retain=False, qos=0):
-        payload = value
-        logger.debug(f'publishing on topic "{topic}", data "{payload}"')
-        pubResult = self._mqtt.publish(topic, payload=payload, qos=qos, retain=retain)
-
-        # If there is an error, then debug log and return not None
-        if pubResult[0] != 0:
-            logger.debug(f'Publishing Result: "{mqtt.error_string(pubResult[0])}"')
-            return pubResult[0]
+    def _publish(self, topic, value, retain=False, qos=0, flush=True):
+        # Queued, a newer value for the topic replaces this one if it couldn't be sent yet
+        if logger.isEnabledFor(logging.DEBUG):
+            # Field values come encoded already, logged as the text they carry
+            logger.debug('publishing on topic "%s", data "%s"', topic,
+                         value.decode('utf-8', 'replace') if isinstance(value, bytes) else value)
+        self.publish_queue.put(topic, value, retain=retain, qos=qos, flush=flush)
 
     def connect_mqtt(self):
         # Setup client
@@ -325,6 +548,12 @@ class AcToMqtt:
         # Set last will and testament
         self._mqtt.will_set(self.config["mqtt_topic_prefix"] + "LWT", "offline", True)
 
+        # Paho reconnects on its own, the queue holds the latest values meanwhile and bounds what is inflight
+        max_inflight = self.config.get("mqtt_max_inflight", 20)
+        self._mqtt.max_inflight_messages_set(max_inflight)
+        self.publish_queue = PublishQueue(self._mqtt, max_inflight=max_inflight,
+                                          max_pending=self.config.get("mqtt_max_pending", 1000))
+
         # Auth
         if self.config["mqtt_user"] and self.config["mqtt_password"]:
             self._mqtt.username_pw_set(self.config["mqtt_user"], self.config["mqtt_password"])
@@ -334,6 +563,7 @@ class AcToMqtt:
         self._mqtt.on_message = self._on_mqtt_message
         self._mqtt.on_log = self._on_mqtt_log
         self._mqtt.on_subscribed = self._mqtt_on_subscribe
+        self._mqtt.on_publish = self.publish_queue.on_publish
 
         # Connect
         logger.debug(
@@ -352,224 +582,116 @@ class AcToMqtt:
         logger.debug("Mqtt Subscribed")
 
     def _on_mqtt_message(self, client, userdata, msg):
-
-        try:
-            logger.debug(
-                f'Mqtt Message Received! Userdata: {userdata}, Message {msg.topic + " " + str(msg.payload)}')
-            # Function is second last .. decode to str #43
-            function = str(msg.topic.split('/')[-2])
-            address = msg.topic.split('/')[-3]
-            # Make sure its proper STR .. python3  #43 .. very
-            address = address.encode('ascii', 'ignore').decode("utf-8")
-            # 43 decode to force to str
-            value = str(msg.payload.decode("ascii"))
-            logger.debug(f'Mqtt decoded --> Function: {function}, Address: {address}, value: {value}')
-
-        except Exception as e:
-            logger.critical(e)
+        if msg.topic == self.birth_topic():
+            if msg.payload == b"online":
+                logger.debug("Home Assistant came online, publishing everything again")
+                future = get_io_loop().submit(self.async_publish_all())
+                future.add_done_callback(self._log_failure)
             return
 
-        # Process received
-        # Probably need to exit here as well if command not send, but should exit on status update
-        # above .. grr, hate stupid python
-        if function == "temp":
-            try:
-                if self.device_objects.get(address):
-                    status = self.device_objects[address].set_temperature(float(value))
-
-                    if status:
-                        self.publish_mqtt_info(status)
-                else:
-                    logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
-                    return
-            except Exception as e:
-                logger.critical(e)
-                return
-
-        elif function == "power":
-            if value.lower() == "on":
-                status = self.device_objects[address].switch_on()
-                if status:
-                    self.publish_mqtt_info(status)
-            elif value.lower() == "off":
-                status = self.device_objects[address].switch_off()
-                if status:
-                    self.publish_mqtt_info(status)
-            else:
-                logger.debug("Switch has invalid value, values is on/off received %s", value)
-                return
-
-        elif function == "mode":
-
-            status = self.device_objects[address].set_mode(value)
-            if status:
-                self.publish_mqtt_info(status)
-
-            else:
-                logger.debug("Mode has invalid value %s", value)
-                return
-
-        elif function == "fanspeed":
-            if value.lower() == "turbo":
-                status = self.device_objects[address].set_turbo("ON")
-
-            # status = self.device_objects[address].set_mute("OFF")
-            elif value.lower() == "mute":
-                status = self.device_objects[address].set_mute("ON")
-
-            else:
-                # status = self.device_objects[address].set_mute("ON")
-                # status = self.device_objects[address].set_turbo("OFF")
-                status = self.device_objects[address].set_fanspeed(value)
-
-            if status:
-                self.publish_mqtt_info(status)
-
-            else:
-                logger.debug("Fanspeed has invalid value %s", value)
-                return
-
-        elif function == "fanspeed_homeassistant":
-            if value.lower() == "turbo":
-                status = self.device_objects[address].set_turbo("ON")
-
-            # status = self.device_objects[address].set_mute("OFF")
-            elif value.lower() == "mute":
-                status = self.device_objects[address].set_mute("ON")
-
-            else:
-                # status = self.device_objects[address].set_mute("ON")
-                # status = self.device_objects[address].set_turbo("OFF")
-                status = self.device_objects[address].set_fanspeed(value)
-
-            if status:
-                self.publish_mqtt_info(status)
-
-            else:
-                logger.debug("Fanspeed_homeassistant has invalid value %s", value)
-                return
-
-        elif function == "mode_homekit":
-
-            status = self.device_objects[address].set_homekit_mode(value)
-            if status:
-                self.publish_mqtt_info(status)
-
-            else:
-                logger.debug("Mode_homekit has invalid value %s", value)
-                return
-        elif function == "mode_homeassistant":
-
-            status = self.device_objects[address].set_homeassistant_mode(value)
-            if status:
-                self.publish_mqtt_info(status)
-
-            else:
-                logger.debug("Mode_homeassistant has invalid value %s", value)
-                return
-        elif function == "state":
+        match = self.command_topic.fullmatch(msg.topic)
+        command = COMMANDS.get(match.group(2)) if match else None
+        if command is None:
+            logger.debug(f'No function match for Mqtt Message {msg.topic + " " + str(msg.payload)}')
+            return
+        address, function = match.groups()
 
-            if value == "refresh":
-                logger.debug("Refreshing states")
-                status = self.device_objects[address].get_ac_status()
-            else:
-                logger.debug(f"Command not valid: {value}")
-                return
+        device = self.device_objects.get(address) if self.device_objects else None
+        if not device:
+            logger.debug(f"Device not on list of devices {address}")
+            return
 
-            if status:
-                self.publish_mqtt_info(status, force_update=True)
-            else:
-                logger.debug("Unable to refresh")
-                return
+        # Everything is parsed and validated here, only valid commands are queued for the device
+        try:
+            # 43 decode to force to str
+            value = command.parse(msg.payload.decode("ascii"))
+            changes = None if command.refresh else command.changes(device, value)
+        except (UnicodeDecodeError, ValueError) as e:
+            logger.debug(f"{function} has invalid value {msg.payload}: {e}")
             return
-        elif function == "fixation_v":
-            try:
-                if self.device_objects.get(address):
-                    status = self.device_objects[address].set_fixation_v(value)
-
-                    if status:
-                        self.publish_mqtt_info(status)
-                else:
-                    logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
-                    return
-            except Exception as e:
-                logger.critical(e)
-                return
-        elif function == "fixation_h":
-            try:
-                if self.device_objects.get(address):
-                    status = self.device_objects[address].set_fixation_h(value)
-                    if status:
-                        self.publish_mqtt_info(status)
-                else:
-                    logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
-                    return
-            except Exception as e:
-                logger.critical(e)
-                return
-        elif function == "display":
-            try:
-                if self.device_objects.get(address):
-                    status = self.device_objects[address].set_display(value)
-                    if status:
-                        self.publish_mqtt_info(status)
-                else:
-                    logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
-                    return
-            except Exception as e:
-                logger.critical(e)
-                return
-        elif function == "mildew":
-            try:
-                if self.device_objects.get(address):
-                    status = self.device_objects[address].set_mildew(value)
-                    if status:
-                        self.publish_mqtt_info(status)
-                else:
-                    logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
-                    return
-            except Exception as e:
-                logger.critical(e)
-                return
-        elif function == "clean":
-            try:
-                if self.device_objects.get(address):
-                    status = self.device_objects[address].set_clean(value)
-                    if status:
-                        self.publish_mqtt_info(status)
-                else:
-                    logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
-                    return
-            except Exception as e:
-                logger.critical(e)
-                return
-        elif function == "health":
-            try:
-                if self.device_objects.get(address):
-                    status = self.device_objects[address].set_health(value)
-                    if status:
-                        self.publish_mqtt_info(status)
-                else:
-                    logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
-                    return
-            except Exception as e:
-                logger.critical(e)
-                return
-        elif function == "sleep":
-            try:
-                if self.device_objects.get(address):
-                    status = self.device_objects[address].set_sleep(value)
-                    if status:
-                        self.publish_mqtt_info(status)
-                else:
-                    logger.debug(f"Device not on list of devices {address}, type: {type(address)}")
-                    return
-            except Exception as e:
-                logger.critical(e)
-                return
+        logger.debug(f'Mqtt Message Received! Function: {function}, Address: {address}, value: {value}')
+
+        if command.refresh:
+            logger.debug("Refreshing states")
+            self.submit_refresh(address, device)
+        elif changes is None:
+            logger.debug(f"{function} has invalid value {value}")
         else:
-            logger.debug("No function match")
+            self.submit_changes(address, device, changes)
+
+    def submit_changes(self, address, device, changes):
+        """Queue changes for the device without blocking, the result is published once accepted."""
+        future = get_io_loop().submit(self._queue_command(address, device, changes=changes))
+        future.add_done_callback(self._log_failure)
+
+    def submit_refresh(self, address, device):
+        """Queue a status refresh for the device without blocking, the result is published when done."""
+        future = get_io_loop().submit(self._queue_command(address, device, call=device.async_get_ac_status))
+        future.add_done_callback(self._on_refreshed)
+
+    def command_queue(self, address):
+        """Command queue of a device, created on first use. Only call from the I/O loop."""
+        if self.command_workers is None:
+            self.command_workers = asyncio.Semaphore(self.config.get('command_workers', 8))
+        if address not in self.command_queues:
+            self.command_queues[address] = CommandQueue(
+                address, self.command_workers, window=self.config.get('command_coalesce_window', 0.05),
+                on_applied=self._on_changes_applied, deadline=self.config.get('command_retry_deadline', 30))
+        return self.command_queues[address]
+
+    async def _queue_command(self, address, device, changes=None, call=None):
+        queue = self.command_queue(address)
+        if address in self.pending_connect:
+            # Without a session the command would go nowhere, connecting goes first in the queue
+            if not await queue.run(device, functools.partial(self._connect_device, address, device)):
+                raise ConnectionError(f"Device {address} - not connected, command dropped")
+        if call is not None:
+            return await queue.run(device, call)
+        if not self.config.get('optimistic_updates'):
+            return await queue.submit(device, changes)
+
+        self.publish_mqtt_info(device.expected_nice_status({**queue.pending_changes(), **changes}))
+        try:
+            return await queue.submit(device, changes)
+        except Exception:
+            # Roll back to what the AC really has, keeping other commands that are still on their way
+            self.publish_mqtt_info(self.expected_status(address, device))
+            raise
+
+    def expected_status(self, address, device):
+        """Nice status of the device with the changes of its queued commands applied. Only call from the I/O loop."""
+        queue = self.command_queues.get(address)
+        pending = queue.pending_changes() if queue else None
+        if pending:
+            return device.expected_nice_status(pending)
+        return device.make_nice_status(device.status)
+
+    def _on_changes_applied(self, address, status):
+        # Poll fast for a while to follow the AC while it acts on the command
+        device = self.device_objects.get(address) if self.device_objects else None
+        policy = self.poll_policy(address, device) if device else None
+        if policy:
+            policy.on_activity()
+            self.scheduler.schedule(address, self.poll_interval(address, device))
+        if status and device and self.config.get('optimistic_updates'):
+            # Commands queued after this write were published already, don't flip them back meanwhile
+            self.publish_mqtt_info(self.expected_status(address, device))
+        elif status:
+            self.publish_mqtt_info(status)
+
+    def _on_refreshed(self, future):
+        if future.exception() is not None:
+            logger.critical(future.exception())
             return
+        if future.result():
+            self.publish_mqtt_info(future.result(), force_update=True)
+        else:
+            logger.debug("Unable to refresh")
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception() is not None:
+            logger.critical(future.exception())
 
     def _on_mqtt_connect(self, client, userdata, flags, rc):
         """
@@ -584,27 +706,17 @@ class AcToMqtt:
         """
 
         logger.debug(f'Mqtt connected! client={client}, userdata={userdata}, flags={flags}, rc={rc}')
+        self.publish_queue.on_connect(client, userdata, flags, rc)
         # Subscribing in on_connect() means that if we lose the connection and
         # reconnect then subscriptions will be renewed.
         sub_topic = self.config["mqtt_topic_prefix"] + "+/+/set"
         client.subscribe(sub_topic)
         logger.debug(f'Listing on {sub_topic} for messages')
 
+        # Home Assistant announces a restart here and then needs discovery and all values again
+        if self.birth_topic():
+            client.subscribe(self.birth_topic())
+            logger.debug(f'Listing on {self.birth_topic()} for Home Assistant restarts')
+
         # LWT
         self._publish(self.config["mqtt_topic_prefix"] + 'LWT', 'online', retain=True)
-
-    def monitor_connections(self):
-        while True:
-            if self.device_objects:
-                for device_key, device in self.device_objects.items():
-                    try:
-                        if not hasattr(device, 'status') or not device.status:
-                            logger.info(f"Reconnecting to device {device_key}")
-                            self.device_objects[device_key] = self.device_config_to_device_object(device.original_config)
-                    except Exception as e:
-                        logger.error(f"Failed to reconnect to device {device_key}: {e}")
-            time.sleep(self.config.get('update_interval', 10))
-
-    def start_monitoring(self):
-        monitor_thread = threading.Thread(target=self.monitor_connections, daemon=True)
-        monitor_thread.start()
@@ -0,0 +1,59 @@
+import logging
+import random
+import time
+
+from broadlink_ac_mqtt.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stops polling a device that doesn't answer, and probes it again after a growing, jittered delay.
+
+    closed: requests flow normally. open: no requests until the backoff delay has passed.
+    half_open: one probe is let through, success closes the breaker, failure opens it for longer.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, base_delay=5.0, max_delay=300.0, jitter=0.2, clock=time.monotonic):
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.clock = clock
+        self.state = None
+        self.consecutive_opens = 0
+        self.retry_at = 0
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.debug(f"Circuit breaker {self.name}: {self.state} -> {state}")
+            self.state = state
+            metrics.set_gauge('circuit_breaker_state', state, device=self.name)
+
+    def allow_request(self):
+        """True if a request may be sent now. In half_open only the first caller gets the probe."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.clock() >= self.retry_at:
+            self._set_state(self.HALF_OPEN)
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_opens = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        delay = min(self.max_delay, self.base_delay * (2 ** self.consecutive_opens))
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        self.consecutive_opens += 1
+        self.retry_at = self.clock() + delay
+        if self.state != self.OPEN:
+            metrics.increment('circuit_breaker_opened', device=self.name)
+        self._set_state(self.OPEN)
+        logger.info(f"Device {self.name} not responding, next probe in {delay:.1f}s")
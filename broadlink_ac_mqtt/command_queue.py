@@ -0,0 +1,198 @@
+import asyncio
+import collections
+import logging
+import random
+import time
+
+from broadlink_ac_mqtt.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_Command = collections.namedtuple('_Command', 'enqueued_at changes call future')
+
+
+class PollPreempted(Exception):
+    """A background poll gave way to commands for the same device."""
+
+
+class CommandQueue:
+    """FIFO of the commands for one device, run in order by a worker task on the I/O loop.
+
+    Consecutive settings are merged into one write, retried with backoff until the deadline, and polls of
+    the device give way to commands.
+    """
+
+    def __init__(self, name, workers, window=0.05, on_applied=None, deadline=30.0, base_delay=0.5, max_delay=8.0,
+                 jitter=0.2, clock=time.monotonic, sleep=asyncio.sleep):
+        # window: seconds to wait for more settings before writing, a scene sends them a few ms apart.
+        # workers: semaphore shared by all queues. on_applied(name, status) follows every accepted write
+        self.name = name
+        self.workers = workers
+        self.window = window
+        self.on_applied = on_applied
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.clock = clock
+        self._sleep = sleep
+        self.device = None
+        self.desired = {}
+        self._queue = collections.deque()
+        self._worker = None
+        self._poll = None
+
+    async def submit(self, device, changes):
+        """Queue field changes and wait for the status of the write that carries them."""
+        self.device = device
+        return await self._enqueue(changes=changes)
+
+    async def run(self, device, call):
+        """Queue call, a coroutine function without arguments, and wait for its result."""
+        self.device = device
+        return await self._enqueue(call=call)
+
+    def pending_changes(self):
+        """Field changes accepted but not yet written, the desired state plus the settings still queued."""
+        changes = dict(self.desired)
+        for command in self._queue:
+            if command.call is None:
+                changes.update(command.changes)
+        return changes
+
+    async def poll(self, device, call):
+        """Run call, a coroutine function polling the device, unless commands are queued for it.
+
+        Raises PollPreempted when the poll was skipped or abandoned for a command.
+        """
+        if self._worker is not None:
+            metrics.increment('polls_deferred', device=self.name)
+            raise PollPreempted(f"Device {self.name} - commands queued, poll skipped")
+        self.device = device
+        poll = self._poll = asyncio.ensure_future(call())
+        try:
+            await asyncio.wait({poll})
+        except asyncio.CancelledError:
+            poll.cancel()
+            raise
+        finally:
+            self._poll = None
+        if poll.cancelled():
+            raise PollPreempted(f"Device {self.name} - poll abandoned for a command")
+        return poll.result()
+
+    async def _enqueue(self, changes=None, call=None):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append(_Command(self.clock(), changes, call, future))
+        metrics.increment('commands_received', device=self.name)
+        metrics.set_gauge('command_queue_depth', len(self._queue), device=self.name)
+        if self._worker is None and self._poll is not None and not getattr(self.device, 'authenticating', False):
+            logger.debug(f"Device {self.name} - abandoning the poll in progress for a command")
+            metrics.increment('polls_preempted', device=self.name)
+            self._poll.cancel()
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._work())
+        return await future
+
+    def _dequeue(self):
+        command = self._queue.popleft()
+        waited = self.clock() - command.enqueued_at
+        metrics.set_gauge('command_queue_depth', len(self._queue), device=self.name)
+        metrics.set_gauge('command_wait_seconds', waited, device=self.name)
+        metrics.increment('command_wait_seconds_total', waited, device=self.name)
+        return command
+
+    async def _work(self):
+        try:
+            if self._poll is not None:
+                await asyncio.wait({self._poll})
+            while self._queue:
+                if self._queue[0].call is None:
+                    await self._sleep(self.window)
+                    await self._reconcile()
+                    continue
+
+                command = self._dequeue()
+                try:
+                    async with self.workers:
+                        result = await command.call()
+                except Exception as e:
+                    self._resolve([command.future], error=e)
+                else:
+                    self._resolve([command.future], result)
+        finally:
+            self._worker = None
+
+    def _take_changes(self):
+        # Only the settings at the head of the queue, a call queued after them has to wait for them
+        futures = []
+        while self._queue and self._queue[0].call is None:
+            command = self._dequeue()
+            self.desired.update(command.changes)
+            futures.append(command.future)
+        return futures
+
+    async def _reconcile(self):
+        give_up_at = self.clock() + self.deadline
+        delay = self.base_delay
+        waiters = []
+        while True:
+            waiters += self._take_changes()
+            if not self.desired:
+                return
+            changes = dict(self.desired)
+
+            metrics.increment('command_batches_sent', device=self.name)
+            logger.debug(f"Device {self.name} - sending {len(waiters)} command(s) as one batch: {changes}")
+            status, error = await self._write(changes)
+            if error is None:
+                self._applied(changes, status, waiters)
+                waiters = []
+                delay = self.base_delay
+                continue
+
+            if self.clock() + delay > give_up_at:
+                logger.warning(f"Device {self.name} - giving up on {self.desired}: {error}")
+                metrics.increment('reconcile_failed', device=self.name)
+                self.desired.clear()
+                self._resolve(waiters, error=error)
+                return
+
+            logger.debug(f"Device {self.name} - write failed ({error}), retrying in {delay:.1f}s")
+            metrics.increment('reconcile_retries', device=self.name)
+            await self._sleep(delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+            delay = min(self.max_delay, delay * 2)
+
+    async def _write(self, changes):
+        # Status and error of one write, a write the device rejected is an error as well
+        try:
+            async with self.workers:
+                status = await self.device.async_apply_changes(changes)
+        except Exception as e:
+            return None, e
+        if getattr(self.device, 'last_write_rejected', False):
+            return status, ConnectionError(f"Device {self.name} rejected the write")
+        return status, None
+
+    def _applied(self, changes, status, waiters):
+        # Keep whatever a newer command changed in the meantime
+        for key, value in changes.items():
+            if self.desired.get(key) == value:
+                del self.desired[key]
+        # The commands are done whatever on_applied does, a failure there mustn't leave them waiting
+        self._resolve(waiters, status)
+        if self.on_applied:
+            try:
+                self.on_applied(self.name, status)
+            except Exception as e:
+                logger.error(f"Device {self.name} - handling the applied changes failed: {e}")
+
+    @staticmethod
+    def _resolve(futures, result=None, error=None):
+        for future in futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,60 @@
+import collections
+import math
+import re
+
+# parse turns the payload into a value or raises ValueError. changes turns it into the field changes
+# of a device, None when the device doesn't know the value. Neither does any I/O, so bad input is
+# rejected before anything is sent. A refresh command has no changes and reads the state instead.
+Command = collections.namedtuple('Command', 'parse changes refresh', defaults=(None, False))
+
+
+def _parse_float(value):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value} is not a finite number")
+    return number
+
+
+def _parse_choice(*choices):
+    def parse(value):
+        if value.lower() not in choices:
+            raise ValueError(f"{value} is not one of {', '.join(choices)}")
+        return value.lower()
+
+    return parse
+
+
+def _fanspeed_changes(device, value):
+    if value.lower() == "turbo":
+        return device.turbo_changes("ON")
+    if value.lower() == "mute":
+        return device.mute_changes("ON")
+    return device.fanspeed_changes(value)
+
+
+def _onoff_changes(key):
+    return lambda device, value: device.onoff_changes(key, value)
+
+
+COMMANDS = {
+    'temp': Command(_parse_float, lambda device, value: device.temperature_changes(value)),
+    'power': Command(_parse_choice("on", "off"), lambda device, value: device.power_changes(value)),
+    'mode': Command(str, lambda device, value: device.mode_changes(value)),
+    'fanspeed': Command(str, _fanspeed_changes),
+    'fanspeed_homeassistant': Command(str, _fanspeed_changes),
+    'mode_homekit': Command(str, lambda device, value: device.homekit_mode_changes(value)),
+    'mode_homeassistant': Command(str, lambda device, value: device.homeassistant_mode_changes(value)),
+    'fixation_v': Command(str, lambda device, value: device.fixation_v_changes(value)),
+    'fixation_h': Command(str, lambda device, value: device.fixation_h_changes(value)),
+    'display': Command(str, _onoff_changes('display')),
+    'mildew': Command(str, _onoff_changes('mildew')),
+    'clean': Command(str, _onoff_changes('clean')),
+    'health': Command(str, _onoff_changes('health')),
+    'sleep': Command(str, _onoff_changes('sleep')),
+    'state': Command(_parse_choice("refresh"), refresh=True),
+}
+
+
+def compile_topic_pattern(topic_prefix):
+    """Regex matching <prefix><mac>/<command>/set, with the MAC and command name as groups."""
+    return re.compile(re.escape(topic_prefix) + r'([^/]+)/([^/]+)/set')
@@ -0,0 +1,38 @@
+import threading
+
+
+class Metrics:
+    """Thread safe counters and gauges of the bridge, optionally per device."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+
+    def increment(self, name, value=1, device=None):
+        with self._lock:
+            values = self._counters.setdefault(name, {})
+            values[device] = values.get(device, 0) + value
+
+    def set_gauge(self, name, value, device=None):
+        with self._lock:
+            self._gauges.setdefault(name, {})[device] = value
+
+    def get(self, name, device=None):
+        with self._lock:
+            for values in (self._counters, self._gauges):
+                if name in values and device in values[name]:
+                    return values[name][device]
+        return None
+
+    def snapshot(self):
+        """Plain dict of all metrics, values not tied to a device are keyed 'total'."""
+        with self._lock:
+            return {
+                kind: {name: {device or 'total': value for device, value in values.items()}
+                       for name, values in metrics.items()}
+                for kind, metrics in (('counters', self._counters), ('gauges', self._gauges))
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,46 @@
+class PollPolicy:
+    """Poll interval of one device that adapts to its activity and power state.
+
+    Right after a command or an observed change the device is polled every fast_interval seconds. Each
+    poll without a change stretches the interval by decay, up to slow_interval. Once it has settled, a
+    device that is switched off is only polled every off_interval seconds.
+    """
+
+    # Changes in these don't count as activity
+    IGNORED = frozenset(('ambient_temp',))
+
+    def __init__(self, fast_interval=2, slow_interval=60, off_interval=300, decay=1.5):
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.off_interval = off_interval
+        self.decay = decay
+        self.current = slow_interval
+        self.powered_off = False
+        self._last_state = None
+
+    @classmethod
+    def from_config(cls, poll_config):
+        """Build from the poll section of a device in the config, None if it has none."""
+        if not poll_config:
+            return None
+        return cls(**{key: poll_config[key] for key in ('fast_interval', 'slow_interval', 'off_interval', 'decay')
+                      if key in poll_config})
+
+    @property
+    def interval(self):
+        if self.powered_off and self.current >= self.slow_interval:
+            return self.off_interval
+        return self.current
+
+    def on_activity(self):
+        self.current = self.fast_interval
+
+    def observe(self, status):
+        """Feed the status a poll returned."""
+        state = {key: value for key, value in status.items() if key not in self.IGNORED}
+        if self._last_state is not None and state != self._last_state:
+            self.on_activity()
+        else:
+            self.current = min(self.slow_interval, self.current * self.decay)
+        self._last_state = state
+        self.powered_off = status.get('power') == "OFF"
@@ -0,0 +1,85 @@
+import collections
+import logging
+import threading
+
+import paho.mqtt.client as mqtt
+
+from broadlink_ac_mqtt.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PublishQueue:
+    """Outgoing MQTT messages, the latest value of each topic, handed to the client max_inflight at a time.
+
+    on_publish and on_connect have to be wired to the client callbacks, without on_publish nothing is released.
+    """
+
+    def __init__(self, client, max_inflight=20, max_pending=1000):
+        self.client = client
+        self.max_inflight = max_inflight
+        self.max_pending = max_pending
+        self.inflight = 0
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, topic, payload, retain=False, qos=0, flush=True):
+        """Queue a message, with flush False it waits for the next flush so a batch is handed over at once."""
+        with self._lock:
+            if topic in self._pending:
+                metrics.increment('mqtt_messages_coalesced')
+            elif len(self._pending) >= self.max_pending:
+                dropped, _ = self._pending.popitem(last=False)
+                logger.debug(f'Publish queue full, dropping "{dropped}"')
+                metrics.increment('mqtt_messages_dropped')
+            self._pending[topic] = (payload, retain, qos)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Hand pending messages to the client, as many as the inflight limit allows."""
+        while True:
+            with self._lock:
+                room = min(self.max_inflight - self.inflight, len(self._pending))
+                if room <= 0 or not self.client.is_connected():
+                    metrics.set_gauge('mqtt_messages_pending', len(self._pending))
+                    return
+                batch = [self._pending.popitem(last=False) for _ in range(room)]
+                self.inflight += room
+
+            # Outside of the lock, the network thread calls on_publish
+            for index, (topic, (payload, retain, qos)) in enumerate(batch):
+                result = self.client.publish(topic, payload=payload, qos=qos, retain=retain)
+                if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                    continue
+                if result.rc == mqtt.MQTT_ERR_NO_CONN:
+                    self._requeue(batch[index:])
+                    return
+                with self._lock:
+                    self.inflight -= 1
+                logger.debug(f'Publishing "{topic}" failed: "{mqtt.error_string(result.rc)}"')
+                metrics.increment('mqtt_messages_dropped')
+
+    def _requeue(self, messages):
+        # Sent again after the reconnect, in their order and unless a newer value came in meanwhile
+        with self._lock:
+            self.inflight -= len(messages)
+            for topic, message in reversed(messages):
+                if topic not in self._pending:
+                    self._pending[topic] = message
+                    self._pending.move_to_end(topic, last=False)
+
+    def on_publish(self, client, userdata, mid):
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+        self.flush()
+
+    def on_connect(self, client, userdata, flags, rc):
+        # Whatever was inflight on the old connection is gone
+        with self._lock:
+            self.inflight = 0
+        if rc == 0:
+            self.flush()
@@ -0,0 +1,106 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class VirtualClock:
+    """Clock that only moves when slept on, to run a scheduler through hours of polls instantly."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.sleeps = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps += 1
+        self.now += max(0.0, seconds)
+
+
+class DeadlineScheduler:
+    """Keeps the next due time of every key in a heap on a monotonic clock.
+
+    wait() sleeps exactly until the earliest deadline, so an idle bridge doesn't wake up at all between
+    polls. schedule() uses the delay as given, only schedule_spread() puts a key at a random point within
+    its interval, so a fleet doesn't poll all at once.
+    Safe to use from several threads, wake() interrupts a wait to let a new deadline be picked up.
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=None, jitter=0.0):
+        self.clock = clock
+        self.jitter = jitter
+        self._sleep = sleep
+        self._heap = []
+        self._due = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def schedule(self, key, delay):
+        """(Re)schedule key delay seconds from now, replacing any earlier deadline."""
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        self.schedule_at(key, self.clock() + max(0.0, delay))
+
+    def schedule_at(self, key, due):
+        with self._lock:
+            self._due[key] = due
+            heapq.heappush(self._heap, (due, next(self._sequence), key))
+        self._wakeup.set()
+
+    def schedule_spread(self, key, interval):
+        """Schedule a new key at a random point within its first interval."""
+        self.schedule_at(key, self.clock() + random.uniform(0, max(0.0, interval)))
+
+    def cancel(self, key):
+        with self._lock:
+            self._due.pop(key, None)
+
+    def next_due(self):
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self):
+        """Remove and return the keys whose deadline has passed, earliest first."""
+        now = self.clock()
+        keys = []
+        with self._lock:
+            self._drop_stale()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, key = heapq.heappop(self._heap)
+                del self._due[key]
+                keys.append(key)
+                self._drop_stale()
+        return keys
+
+    def wait(self, timeout=None):
+        """Sleep until the next deadline, at most timeout seconds, or until wake() is called."""
+        due = self.next_due()
+        delay = timeout
+        if due is not None:
+            delay = max(0.0, due - self.clock())
+            if timeout is not None:
+                delay = min(delay, timeout)
+        if self._sleep is not None:
+            self._sleep(delay or 0.0)
+            return
+        self._wakeup.clear()
+        # A deadline added between next_due() and clear() must not be slept through
+        if due != self.next_due():
+            return
+        self._wakeup.wait(delay)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _drop_stale(self):
+        # Rescheduling leaves the old entry in the heap, it is skipped here
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
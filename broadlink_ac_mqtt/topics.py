@@ -0,0 +1,55 @@
+class _TopicTable(dict):
+    # <base>/<key><suffix>, built the first time a key is used and kept
+    def __init__(self, base, suffix):
+        super().__init__()
+        self.base = base
+        self.suffix = suffix
+
+    def __missing__(self, key):
+        topic = self[key] = self.base + '/' + key + self.suffix
+        return topic
+
+
+class DeviceTopics:
+    """MQTT topics of one device, built once when the device is registered instead of on every publish.
+
+    value and set map a field or command name to <prefix><mac>/<name>/value and <prefix><mac>/<name>/set.
+    """
+
+    __slots__ = ('value', 'set', 'state', 'discovery')
+
+    def __init__(self, topic_prefix, macaddress, discovery_prefix=None):
+        base = topic_prefix + macaddress
+        self.value = _TopicTable(base, '/value')
+        self.set = _TopicTable(base, '/set')
+        self.state = base + '/state'
+        self.discovery = discovery_prefix + '/climate/' + macaddress + '/config' if discovery_prefix else None
+
+
+# Encoded field values. They come from a small vocabulary (ON, OFF, COOLING, setpoints, ...), the bound
+# only matters if a device reports garbage
+_PAYLOADS = {}
+_MAX_PAYLOADS = 4096
+
+
+def encode_payload(value):
+    """Bytes paho would send for value, cached for the values fields repeat over and over."""
+    # Keyed by type as well, 22 and 22.0 are equal but encode differently
+    key = (value.__class__, value)
+    try:
+        return _PAYLOADS[key]
+    except KeyError:
+        pass
+    except TypeError:
+        return value
+    if value is None:
+        payload = b''
+    elif isinstance(value, str):
+        payload = value.encode('utf-8')
+    elif isinstance(value, (int, float)):
+        payload = str(value).encode('ascii')
+    else:
+        return value
+    if len(_PAYLOADS) < _MAX_PAYLOADS:
+        _PAYLOADS[key] = payload
+    return payload
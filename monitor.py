@@ -63,9 +63,28 @@ def read_config(config_file_path):
     # Service settings
     config["daemon_mode"] = config_file["service"]["daemon_mode"]
     config["update_interval"] = config_file["service"]["update_interval"]
+    # Ambient temperature refresh, can be overridden per device with info_interval/state_interval
+    config["info_interval"] = config_file["service"].get("info_interval", 60)
+    # Setters trust a state read at most this many seconds ago instead of reading it again first
+    config["state_max_age"] = config_file["service"].get("state_max_age", 10)
     config["self_discovery"] = config_file["service"]["self_discovery"]
+    # How often bridge metrics are published to <topic_prefix>bridge/metrics
+    config["metrics_interval"] = config_file["service"].get("metrics_interval", 60)
+    # Commands for a device arriving within this many seconds are sent to it as one
+    config["command_coalesce_window"] = config_file["service"].get("command_coalesce_window", 0.05)
+    # How many devices execute commands at the same time, commands for one device always run in order
+    config["command_workers"] = config_file["service"].get("command_workers", 8)
+    # Devices authenticating at the same time at startup
+    config["connect_workers"] = config_file["service"].get("connect_workers", 8)
+    # Failed commands are retried with backoff for up to this many seconds
+    config["command_retry_deadline"] = config_file["service"].get("command_retry_deadline", 30)
+    # Publish the values a command sets right away, rolled back if the AC doesn't take them
+    config["optimistic_updates"] = config_file["service"].get("optimistic_updates", False)
     # What ip to bind to
     config['bind_to_ip'] = config_file["service"].get("bind_to_ip") or None
+    # Where to keep device sessions, defaults to next to the config file
+    config['session_cache'] = config_file["service"].get("session_cache") or os.path.join(
+        os.path.dirname(os.path.abspath(config_file_path)), 'session_cache.json')
 
     # Mqtt settings
     config["mqtt_host"] = config_file["mqtt"].get("host")
@@ -76,6 +95,14 @@ def read_config(config_file_path):
     config["mqtt_client_id"] = config_file["mqtt"]["client_id"] if config_file["mqtt"][
         "client_id"] else 'broadlink_to_mqtt-' + str(time.time())
     config["mqtt_topic_prefix"] = config_file["mqtt"]["topic_prefix"]
+    # Unchanged values are published again every this many seconds, 0 to only publish changes
+    config["mqtt_heartbeat_interval"] = config_file["mqtt"].get("heartbeat_interval", 300)
+    # Publish the status of a device as one JSON document on <prefix><mac>/state instead of a topic per value
+    config["mqtt_json_state"] = config_file["mqtt"].get("json_state", False)
+    # Messages handed to the client at once, the rest wait in a queue keeping the latest value per topic
+    config["mqtt_max_inflight"] = config_file["mqtt"].get("max_inflight", 20)
+    # Topics the queue holds at most while the broker is unreachable
+    config["mqtt_max_pending"] = config_file["mqtt"].get("max_pending", 1000)
     config["mqtt_auto_discovery_topic"] = config_file["mqtt"]["auto_discovery_topic"] if "auto_discovery_topic" in \
                                                                                          config_file["mqtt"] else False
     config["mqtt_auto_discovery_topic_retain"] = config_file["mqtt"][
@@ -169,6 +196,8 @@ def stop(signal_number=0, frame=0):
     logger.info(f"Stopping due to signal {signal_number}")
     global do_loop
     do_loop = False
+    if AC is not None:
+        AC.scheduler.wake()
     while running:
         logger.info("Waiting to stop")
         time.sleep(1)
@@ -357,47 +386,21 @@ def start():
         # One loop
         do_loop = True if config["daemon_mode"] else False
 
-        def validate_device_reconnection(device):
-            try:
-                # Attempt to authenticate or fetch status to validate reconnection
-                if not device.auth():
-                    logger.warning(f"Device {device.name} failed to authenticate after reconnection.")
-                    return False
-                status = device.get_ac_status()
-                if not status:
-                    logger.warning(f"Device {device.name} failed to fetch status after reconnection.")
-                    return False
-                return True
-            except Exception as e:
-                logger.error(f"Error validating device {device.name} after reconnection: {e}")
-                return False
-
-        iteration = 0
         # Run main loop
         while do_loop:
             running = True
 
             try:
-                if iteration % 3 == 0:
-                    for key, device in devices.items():
-                        if not hasattr(device, 'status') or not device.status:
-                            logger.info(f"Device {key} is disconnected, attempting reconnection.")
-                            new_device = AC.device_config_to_device_object(device.original_config)
-                            if validate_device_reconnection(new_device):
-                                devices[key] = new_device
-                                logger.info(f"Device {key} reconnected successfully.")
-                            else:
-                                logger.warning(f"Device {key} reconnection failed.")
-
+                # Unreachable devices are probed and rebuilt by their circuit breaker in publish_devices_status
                 AC.publish_devices_status(config, devices)
                 touch_pid_file()
+                # Sleep until the next device is due, waking up in time to keep the pid file fresh
+                AC.wait_for_next_poll(timeout=pid_stale_time - 2)
 
             except Exception as e:
                 logger.debug(traceback.format_exc())
                 logger.error(e)
 
-            iteration += 1
-
     except KeyboardInterrupt:
         logging.debug("User Keyboard interrupted")
 
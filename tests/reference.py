@@ -0,0 +1,165 @@
+"""Implementations the optimized code replaced, the reference it is tested and benchmarked against."""
+from broadlink_ac_mqtt.ac_communication.broadlink.ac_db import ac_db
+from broadlink_ac_mqtt.ac_communication.broadlink.state_codec import AC_STATE_CODEC
+
+STATIC = ac_db.STATIC
+
+
+def legacy_encode_frame(mac, command, count, session_id, payload, encrypt):
+    # The byte by byte frame builder device.send_packet used before FrameCodec
+    packet = bytearray(0x38)
+    packet[0x00] = 0x5a
+    packet[0x01] = 0xa5
+    packet[0x02] = 0xaa
+    packet[0x03] = 0x55
+    packet[0x04] = 0x5a
+    packet[0x05] = 0xa5
+    packet[0x06] = 0xaa
+    packet[0x07] = 0x55
+    packet[0x24] = 0x2a
+    packet[0x25] = 0x4e
+    packet[0x26] = command
+    packet[0x28] = count & 0xff
+    packet[0x29] = count >> 8
+    packet[0x2a] = mac[0]
+    packet[0x2b] = mac[1]
+    packet[0x2c] = mac[2]
+    packet[0x2d] = mac[3]
+    packet[0x2e] = mac[4]
+    packet[0x2f] = mac[5]
+    packet[0x30] = session_id[0]
+    packet[0x31] = session_id[1]
+    packet[0x32] = session_id[2]
+    packet[0x33] = session_id[3]
+
+    checksum = 0xbeaf
+    for i in range(len(payload)):
+        checksum += payload[i]
+        checksum = checksum & 0xffff
+
+    payload = encrypt(bytes(payload))
+
+    packet[0x34] = checksum & 0xff
+    packet[0x35] = checksum >> 8
+
+    for i in range(len(payload)):
+        packet.append(payload[i])
+
+    checksum = 0xbeaf
+    for i in range(len(packet)):
+        checksum += packet[i]
+        checksum = checksum & 0xffff
+    packet[0x20] = checksum & 0xff
+    packet[0x21] = checksum >> 8
+    return packet
+
+
+def _get_key(list, search_value):
+    for key, value in list.items():
+        if value == search_value:
+            return key
+    return search_value
+
+
+def legacy_make_nice_status(status):
+    # The get_key based ac_db.make_nice_status, on a plain status dict
+    status_nice = {}
+    status_nice['temp'] = status['temp']
+    status_nice['ambient_temp'] = status['ambient_temp']
+    status_nice['power'] = _get_key(STATIC.ONOFF.__dict__, status['power'])
+    status_nice['fixation_v'] = _get_key(STATIC.FIXATION.VERTICAL.__dict__, status['fixation_v'])
+    status_nice['mode'] = _get_key(STATIC.MODE.__dict__, status['mode'])
+    status_nice['sleep'] = _get_key(STATIC.ONOFF.__dict__, status['sleep'])
+    status_nice['display'] = _get_key(STATIC.ONOFF.__dict__, status['display'])
+    status_nice['mildew'] = _get_key(STATIC.ONOFF.__dict__, status['mildew'])
+    status_nice['health'] = _get_key(STATIC.ONOFF.__dict__, status['health'])
+    status_nice['fixation_h'] = _get_key(STATIC.FIXATION.HORIZONTAL.__dict__, status['fixation_h'])
+    status_nice['ifeel'] = _get_key(STATIC.ONOFF.__dict__, status['ifeel'])
+    status_nice['mute'] = _get_key(STATIC.ONOFF.__dict__, status['mute'])
+    status_nice['turbo'] = _get_key(STATIC.ONOFF.__dict__, status['turbo'])
+    status_nice['clean'] = _get_key(STATIC.ONOFF.__dict__, status['clean'])
+    status_nice['macaddress'] = status['macaddress']
+    status_nice['device_name'] = status['devicename']
+
+    if status['power'] == STATIC.ONOFF.OFF:
+        status_nice['mode_homekit'] = "Off"
+    elif status['power'] == STATIC.ONOFF.ON and status['mode'] == STATIC.MODE.AUTO:
+        status_nice['mode_homekit'] = "Auto"
+    elif status['power'] == STATIC.ONOFF.ON and status['mode'] == STATIC.MODE.HEATING:
+        status_nice['mode_homekit'] = "HeatOn"
+    elif status['power'] == STATIC.ONOFF.ON and status['mode'] == STATIC.MODE.COOLING:
+        status_nice['mode_homekit'] = "CoolOn"
+    else:
+        status_nice['mode_homekit'] = "Error"
+
+    if status['power'] == STATIC.ONOFF.OFF:
+        status_nice['mode_homeassistant'] = "off"
+    elif status['power'] == STATIC.ONOFF.ON and status['mode'] == STATIC.MODE.AUTO:
+        status_nice['mode_homeassistant'] = "auto"
+    elif status['power'] == STATIC.ONOFF.ON and status['mode'] == STATIC.MODE.HEATING:
+        status_nice['mode_homeassistant'] = "heat"
+    elif status['power'] == STATIC.ONOFF.ON and status['mode'] == STATIC.MODE.COOLING:
+        status_nice['mode_homeassistant'] = "cool"
+    elif status['power'] == STATIC.ONOFF.ON and status['mode'] == STATIC.MODE.DRY:
+        status_nice['mode_homeassistant'] = "dry"
+    elif status['power'] == STATIC.ONOFF.ON and status['mode'] == STATIC.MODE.FAN:
+        status_nice['mode_homeassistant'] = "fan_only"
+    else:
+        status_nice['mode_homeassistant'] = "Error"
+
+    status_nice['fanspeed'] = _get_key(STATIC.FAN.__dict__, status['fanspeed'])
+    status_nice['fanspeed_homeassistant'] = _get_key(STATIC.FAN.__dict__, status['fanspeed']).title()
+
+    if status_nice['mute'] == "ON":
+        status_nice['fanspeed_homeassistant'] = "Mute"
+        status_nice['fanspeed'] = "MUTE"
+    elif status_nice['turbo'] == "ON":
+        status_nice['fanspeed_homeassistant'] = "Turbo"
+        status_nice['fanspeed'] = "TURBO"
+
+    return status_nice
+
+
+def random_values(rng):
+    # Only values that have a name, the legacy code fails on an unnamed fan speed
+    return {
+        'temp': rng.randrange(32, 65) / 2,
+        'fixation_v': rng.randrange(1, 8),
+        'power': rng.randrange(2),
+        'mode': rng.choice((0, 1, 2, 4, 6)),
+        'sleep': rng.randrange(2),
+        'display': rng.randrange(2),
+        'health': rng.randrange(2),
+        'ifeel': rng.randrange(2),
+        'fixation_h': rng.randrange(8),
+        'fanspeed': rng.choice((0, 1, 2, 3, 5)),
+        'turbo': rng.randrange(2),
+        'mute': rng.randrange(2),
+        'clean': rng.randrange(2),
+        'mildew': rng.randrange(2),
+        'ambient_temp': rng.randrange(10, 35),
+    }
+
+
+def legacy_decode_state(response_payload, status):
+    # The hand written decoding get_ac_states used, with fixation_h as ac_db_debug decoded it
+    status['temp'] = 8 + (response_payload[10] >> 3) + (0.5 * float(response_payload[12] >> 7))
+    status['power'] = response_payload[18] >> 5 & 0b00000001
+    status['fixation_v'] = response_payload[10] & 0b00000111
+    status['mode'] = response_payload[15] >> 5 & 0b00001111
+    status['sleep'] = response_payload[15] >> 2 & 0b00000001
+    status['display'] = response_payload[20] >> 4 & 0b00000001
+    status['mildew'] = response_payload[20] >> 3 & 0b00000001
+    status['health'] = response_payload[18] >> 1 & 0b00000001
+    status['fixation_h'] = response_payload[11] >> 5 & 0b00000111
+    status['fanspeed'] = response_payload[13] >> 5 & 0b00000111
+    status['ifeel'] = response_payload[15] >> 3 & 0b00000001
+    status['mute'] = response_payload[14] >> 7 & 0b00000001
+    status['turbo'] = response_payload[14] >> 6 & 0b00000001
+    status['clean'] = response_payload[18] >> 2 & 0b00000001
+
+
+def random_state(rng):
+    state = {field.name: rng.randrange(1 << field.width) for field in AC_STATE_CODEC.fields if field.name != 'temp'}
+    state['temp'] = rng.randrange(32, 65) / 2
+    return state
@@ -0,0 +1,109 @@
+import asyncio
+
+from broadlink_ac_mqtt.command_queue import CommandQueue
+from broadlink_ac_mqtt.metrics import metrics
+from tests.fake_ac import FakeAc
+from tests.test_device_session import make_device
+
+
+def connected(fake):
+    device = make_device(fake)
+    asyncio.run(device.async_connect())
+    return device
+
+
+def test_changes_the_ac_already_has_are_not_written():
+    fake = FakeAc()
+    device = connected(fake)
+    skipped = metrics.get('writes_skipped', device=device.status['macaddress']) or 0
+
+    status = asyncio.run(device.async_apply_changes(device.temperature_changes(22)))
+    assert status['temp'] == 22
+    assert fake.writes == []
+    assert metrics.get('writes_skipped', device=device.status['macaddress']) == skipped + 1
+
+    # One field that differs is enough for a write
+    asyncio.run(device.async_apply_changes({'temp': 22, 'power': device.STATIC.ONOFF.OFF}))
+    assert len(fake.writes) == 1
+
+
+def test_accepted_write_updates_the_status():
+    fake = FakeAc()
+    device = connected(fake)
+    status = asyncio.run(device.async_apply_changes(device.temperature_changes(25)))
+    assert status['temp'] == 25
+    assert device.status['temp'] == 25
+    assert not device.last_write_rejected
+    assert len(fake.writes) == 1
+
+
+def test_rejected_write_rolls_the_fields_back():
+    fake = FakeAc()
+    device = connected(fake)
+    fake.reject_writes = True
+
+    status = asyncio.run(device.async_apply_changes({'temp': 25, 'power': device.STATIC.ONOFF.OFF}))
+    assert device.last_write_rejected
+    assert status['temp'] == 22
+    assert device.status['temp'] == 22
+    assert device.status['power'] == device.STATIC.ONOFF.ON
+    assert len(fake.writes) == 1
+
+    # The state is read again before the next write rather than trusted
+    assert not device.state_is_fresh()
+    fake.reject_writes = False
+    sent = len(fake.sent)
+    asyncio.run(device.async_apply_changes(device.temperature_changes(25)))
+    assert len(fake.sent) - sent == 2
+    assert device.status['temp'] == 25
+    assert not device.last_write_rejected
+
+
+def test_queue_converges_and_clears_the_desired_state():
+    async def scenario():
+        fake = FakeAc()
+        device = make_device(fake)
+        await device.async_connect()
+        fake.reject_writes = True
+        queue = CommandQueue('test', asyncio.Semaphore(1), base_delay=0.01, jitter=0)
+        write = asyncio.ensure_future(queue.submit(device, device.temperature_changes(26)))
+        while not fake.writes:
+            await asyncio.sleep(0.001)
+        # Rejected writes keep the setting desired until the AC takes it
+        assert queue.desired == {'temp': 26}
+        fake.reject_writes = False
+        status = await write
+        return fake, device, queue, status
+
+    fake, device, queue, status = asyncio.run(scenario())
+    assert status['temp'] == 26
+    assert device.status['temp'] == 26
+    assert queue.desired == {}
+    assert len(fake.writes) >= 2
+
+
+def test_convergence_keeps_a_newer_desired_value():
+    async def scenario():
+        fake = FakeAc()
+        device = make_device(fake)
+        await device.async_connect()
+        queue = CommandQueue('test', asyncio.Semaphore(1), window=0)
+        original = device.async_apply_changes
+        written = []
+
+        async def apply_changes(changes):
+            written.append(dict(changes))
+            if len(written) == 1:
+                # A newer setting for the same field arrives while the write is in flight
+                queue.desired['temp'] = 30
+            return await original(changes)
+
+        device.async_apply_changes = apply_changes
+        await queue.submit(device, device.temperature_changes(26))
+        return device, queue, written
+
+    device, queue, written = asyncio.run(scenario())
+    # Writing 26 didn't clear the newer 30, it was written next
+    assert written == [{'temp': 26}, {'temp': 30}]
+    assert device.status['temp'] == 30
+    assert queue.desired == {}
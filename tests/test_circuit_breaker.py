@@ -0,0 +1,63 @@
+import pytest
+
+from broadlink_ac_mqtt.circuit_breaker import CircuitBreaker
+from broadlink_ac_mqtt.scheduler import VirtualClock
+
+
+def make_breaker(**kwargs):
+    clock = VirtualClock()
+    kwargs.setdefault('jitter', 0)
+    return clock, CircuitBreaker('test', base_delay=5, max_delay=40, clock=clock, **kwargs)
+
+
+def test_closed_breaker_lets_requests_through():
+    _, breaker = make_breaker()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_failure_opens_then_a_probe_closes_it():
+    clock, breaker = make_breaker()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_at == 5
+
+    clock.sleep(4.9)
+    assert not breaker.allow_request()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.sleep(0.1)
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_opens == 0
+    assert breaker.allow_request()
+
+
+def test_failed_probe_opens_it_for_longer():
+    clock, breaker = make_breaker()
+    delays = []
+    for _ in range(5):
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        delays.append(breaker.retry_at - clock())
+        clock.sleep(delays[-1])
+        assert breaker.allow_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert delays == [5, 10, 20, 40, 40]
+
+    # Success starts the backoff over
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.retry_at - clock() == 5
+
+
+def test_delay_is_jittered():
+    clock, breaker = make_breaker(jitter=0.2)
+    breaker.record_failure()
+    assert breaker.retry_at - clock() == pytest.approx(5, rel=0.2)
@@ -0,0 +1,243 @@
+import asyncio
+
+import pytest
+
+from broadlink_ac_mqtt.command_queue import CommandQueue, PollPreempted
+from broadlink_ac_mqtt.scheduler import VirtualClock
+
+
+class Device:
+    """Takes every write and reports the state it has, fail makes the next writes raise."""
+
+    def __init__(self, events=None):
+        self.state = {}
+        self.writes = []
+        self.fail = 0
+        self.last_write_rejected = False
+        self.authenticating = False
+        self.events = [] if events is None else events
+
+    async def async_apply_changes(self, changes):
+        self.writes.append(dict(changes))
+        self.events.append(('write', dict(changes)))
+        await asyncio.sleep(0)
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("timed out")
+        self.state.update(changes)
+        return dict(self.state)
+
+
+def make_queue(clock=None, workers=None, **kwargs):
+    clock = clock or VirtualClock()
+
+    async def sleep(seconds):
+        clock.sleep(seconds)
+        await asyncio.sleep(0)
+
+    kwargs.setdefault('jitter', 0)
+    return CommandQueue('test', workers or asyncio.Semaphore(8), clock=clock, sleep=sleep, **kwargs), clock
+
+
+def test_settings_are_coalesced_into_one_write():
+    async def scenario():
+        queue, _ = make_queue()
+        device = Device()
+        results = await asyncio.gather(queue.submit(device, {'mode': 1}), queue.submit(device, {'temp': 20}),
+                                       queue.submit(device, {'temp': 24}), queue.submit(device, {'fanspeed': 2}))
+        return device, results
+
+    device, results = asyncio.run(scenario())
+    assert device.writes == [{'mode': 1, 'temp': 24, 'fanspeed': 2}]
+    # Every command gets the status of the write that carried it
+    assert all(result == {'mode': 1, 'temp': 24, 'fanspeed': 2} for result in results)
+
+
+def test_commands_run_in_order():
+    async def scenario():
+        queue, _ = make_queue()
+        events = []
+        device = Device(events)
+
+        async def refresh():
+            events.append(('refresh',))
+            return 'refreshed'
+
+        results = await asyncio.gather(queue.submit(device, {'temp': 20}), queue.submit(device, {'power': 1}),
+                                       queue.run(device, refresh), queue.submit(device, {'temp': 22}))
+        return events, results
+
+    events, results = asyncio.run(scenario())
+    # Settings queued after a call wait for it, they aren't merged into the write before it
+    assert events == [('write', {'temp': 20, 'power': 1}), ('refresh',), ('write', {'temp': 22})]
+    assert results[2] == 'refreshed'
+
+
+def test_failed_write_is_retried_with_backoff():
+    async def scenario():
+        queue, clock = make_queue(base_delay=0.5, max_delay=2.0, deadline=30)
+        device = Device()
+        device.fail = 4
+        started = clock()
+        result = await queue.submit(device, {'temp': 21})
+        return device, result, clock() - started, queue
+
+    device, result, took, queue = asyncio.run(scenario())
+    assert len(device.writes) == 5
+    assert result == {'temp': 21}
+    # Coalescing window, then 0.5 + 1 + 2 + 2 between the attempts
+    assert took == pytest.approx(0.05 + 0.5 + 1 + 2 + 2)
+    assert queue.desired == {}
+
+
+def test_write_is_dropped_at_the_deadline():
+    async def scenario():
+        queue, clock = make_queue(base_delay=0.5, max_delay=8.0, deadline=10)
+        device = Device()
+        device.fail = 100
+        started = clock()
+        with pytest.raises(ConnectionError):
+            await queue.submit(device, {'temp': 21})
+        return device, clock() - started, queue
+
+    device, took, queue = asyncio.run(scenario())
+    # 0.5 + 1 + 2 + 4 fit the deadline, another 8 wouldn't
+    assert len(device.writes) == 5
+    assert took == pytest.approx(0.05 + 0.5 + 1 + 2 + 4)
+    assert queue.desired == {}
+
+
+def test_settings_queued_during_a_retry_join_it():
+    async def scenario():
+        queue, _ = make_queue(base_delay=1)
+        device = Device()
+        device.fail = 1
+        first = asyncio.ensure_future(queue.submit(device, {'temp': 21}))
+        while not device.writes:
+            await asyncio.sleep(0)
+        second = asyncio.ensure_future(queue.submit(device, {'temp': 23, 'power': 0}))
+        return device, await first, await second
+
+    device, first, second = asyncio.run(scenario())
+    assert device.writes == [{'temp': 21}, {'temp': 23, 'power': 0}]
+    assert first == second == {'temp': 23, 'power': 0}
+
+
+def test_command_abandons_the_poll_in_progress():
+    async def scenario():
+        queue, _ = make_queue()
+        device = Device()
+        polled = asyncio.Event()
+
+        async def slow_poll():
+            polled.set()
+            await asyncio.sleep(3600)
+
+        poll = asyncio.ensure_future(queue.poll(device, slow_poll))
+        await polled.wait()
+        result = await queue.submit(device, {'temp': 20})
+        with pytest.raises(PollPreempted):
+            await poll
+        return result
+
+    assert asyncio.run(scenario()) == {'temp': 20}
+
+
+def test_poll_is_skipped_while_commands_are_queued():
+    async def scenario():
+        queue, _ = make_queue()
+        device = Device()
+        command = asyncio.ensure_future(queue.submit(device, {'temp': 20}))
+        await asyncio.sleep(0)
+
+        async def poll():
+            return 'polled'
+
+        with pytest.raises(PollPreempted):
+            await queue.poll(device, poll)
+        await command
+        # Once the queue is idle polls run again
+        return await queue.poll(device, poll)
+
+    assert asyncio.run(scenario()) == 'polled'
+
+
+def test_poll_in_the_middle_of_auth_is_waited_for():
+    async def scenario():
+        queue, _ = make_queue()
+        events = []
+        device = Device(events)
+        authenticating = asyncio.Event()
+        release = asyncio.Event()
+
+        async def connect():
+            device.authenticating = True
+            authenticating.set()
+            await release.wait()
+            device.authenticating = False
+            events.append(('connected',))
+            return 'connected'
+
+        poll = asyncio.ensure_future(queue.poll(device, connect))
+        await authenticating.wait()
+        command = asyncio.ensure_future(queue.submit(device, {'temp': 20}))
+        await asyncio.sleep(0)
+        release.set()
+        return events, await poll, await command
+
+    events, polled, result = asyncio.run(scenario())
+    assert polled == 'connected'
+    assert events == [('connected',), ('write', {'temp': 20})]
+
+
+def test_workers_bound_the_queues_executing_at_once():
+    async def scenario():
+        workers = asyncio.Semaphore(2)
+        clock = VirtualClock()
+        running = []
+        peak = []
+
+        class SlowDevice(Device):
+            async def async_apply_changes(self, changes):
+                running.append(self)
+                peak.append(len(running))
+                for _ in range(5):
+                    await asyncio.sleep(0)
+                running.remove(self)
+                return dict(changes)
+
+        queues = [make_queue(clock, workers)[0] for _ in range(6)]
+        await asyncio.gather(*(queue.submit(SlowDevice(), {'temp': 20}) for queue in queues))
+        return max(peak)
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_waiters_resolve_before_on_applied_and_survive_its_errors():
+    resolved = []
+
+    def on_applied(name, status):
+        resolved.append(all(future.done() for future in waiters))
+        raise RuntimeError("publishing failed")
+
+    async def scenario():
+        queue, _ = make_queue(on_applied=on_applied)
+        device = Device()
+        original = queue._take_changes
+
+        def take_changes():
+            futures = original()
+            waiters.extend(futures)
+            return futures
+
+        queue._take_changes = take_changes
+        first = await asyncio.gather(queue.submit(device, {'temp': 20}), queue.submit(device, {'power': 1}))
+        # The worker survived, later commands still go through
+        second = await queue.submit(device, {'temp': 22})
+        return first, second
+
+    waiters = []
+    first, second = asyncio.run(scenario())
+    assert first == [{'temp': 20, 'power': 1}] * 2
+    assert second == {'temp': 22, 'power': 1}
+    assert resolved == [True, True]
@@ -0,0 +1,55 @@
+import os
+import random
+
+import pytest
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from broadlink_ac_mqtt.ac_communication.broadlink.crypto_engine import AesCbcEngine
+
+
+def fresh_encrypt(key, iv, payload):
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    return encryptor.update(payload) + encryptor.finalize()
+
+
+def fresh_decrypt(key, iv, payload):
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+    return decryptor.update(payload) + decryptor.finalize()
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_consecutive_packets_match_a_fresh_cipher_per_call(seed):
+    rng = random.Random(seed)
+    key = rng.randbytes(16)
+    iv = rng.randbytes(16)
+    engine = AesCbcEngine(key, iv)
+    # Encrypts and decrypts interleaved, as requests and replies are, every one restarting from the IV
+    for _ in range(50):
+        payload = rng.randbytes(16 * rng.randrange(0, 6))
+        assert engine.encrypt(payload) == fresh_encrypt(key, iv, payload)
+        reply = rng.randbytes(16 * rng.randrange(0, 6))
+        assert engine.decrypt(reply) == fresh_decrypt(key, iv, reply)
+
+
+def test_round_trip():
+    key, iv = os.urandom(16), os.urandom(16)
+    engine = AesCbcEngine(key, iv)
+    for size in (16, 32, 48, 80):
+        payload = os.urandom(size)
+        assert engine.decrypt(engine.encrypt(payload)) == payload
+
+
+def test_accepts_bytearray_and_memoryview():
+    key, iv = os.urandom(16), os.urandom(16)
+    engine = AesCbcEngine(bytearray(key), bytearray(iv))
+    payload = os.urandom(32)
+    assert engine.encrypt(bytearray(payload)) == fresh_encrypt(key, iv, payload)
+    assert engine.decrypt(memoryview(payload)) == fresh_decrypt(key, iv, payload)
+
+
+def test_unpadded_length_is_rejected():
+    engine = AesCbcEngine(os.urandom(16), os.urandom(16))
+    with pytest.raises(ValueError):
+        engine.encrypt(b'x' * 15)
+    with pytest.raises(ValueError):
+        engine.decrypt(b'x' * 17)
@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+from broadlink_ac_mqtt.ac_communication.broadlink import device_factory
+from broadlink_ac_mqtt.ac_communication.broadlink.session_cache import SessionCache
+from tests.fake_ac import FakeAc
+
+AUTH = 0x65
+REQUEST = 0x6a
+MAC = bytearray.fromhex('b4430dce73f1')
+
+
+def make_device(fake, session_cache=None):
+    device = device_factory.create_device(dev_type=0x4E2a, host=('127.0.0.1', 80), mac=MAC, name='test',
+                                          session_cache=session_cache, connect=False)
+    device._async_request = fake.request
+    return device
+
+
+def test_connect_authenticates_and_reads_the_state():
+    fake = FakeAc()
+    device = make_device(fake)
+    status = asyncio.run(device.async_connect())
+    assert status['temp'] == 22
+    assert status['ambient_temp'] == 23
+    assert len(fake.commands(AUTH)) == 1
+
+
+def test_stale_cached_session_authenticates_once_and_resends_every_request(tmp_path):
+    fake = FakeAc(delay=0.01)
+    cache = SessionCache(str(tmp_path / 'sessions'))
+    cache.put(MAC, bytearray(b'\x01\x02\x03\x04'), bytearray(os.urandom(16)))
+    device = make_device(fake, cache)
+
+    # States and info go out concurrently, both come back stale
+    status = asyncio.run(device.async_connect())
+    assert status['temp'] == 22
+    assert status['ambient_temp'] == 23
+    assert [command for command, _ in fake.sent] == [REQUEST, REQUEST, AUTH, REQUEST, REQUEST]
+    assert all(session_id == fake.session_id for _, session_id in fake.sent[3:])
+
+
+def test_session_rejected_after_it_was_verified():
+    fake = FakeAc()
+    device = make_device(fake)
+
+    async def scenario():
+        await device.async_connect()
+        # The AC reboots, the session that worked so far is refused from now on
+        fake.forget_session()
+        return await device.async_apply_changes(device.temperature_changes(25))
+
+    status = asyncio.run(scenario())
+    assert status['temp'] == 25
+    assert not device.last_write_rejected
+    assert len(fake.commands(AUTH)) == 2
+    assert fake.sent[-1] == (REQUEST, fake.session_id)
+
+
+def test_failed_reauth_is_tried_again_by_the_next_request():
+    fake = FakeAc()
+    device = make_device(fake)
+    asyncio.run(device.async_connect())
+    fake.forget_session()
+
+    answer = fake.request
+
+    async def auth_times_out(packet, timeout=None):
+        if packet[0x26] == AUTH:
+            raise ConnectionError("timed out")
+        return await answer(packet, timeout)
+
+    device._async_request = auth_times_out
+    try:
+        asyncio.run(device.async_get_ac_states(force_update=True))
+    except ConnectionError:
+        pass
+
+    device._async_request = answer
+    status = asyncio.run(device.async_get_ac_states(force_update=True))
+    assert status['temp'] == 22
@@ -0,0 +1,55 @@
+import os
+import random
+
+import pytest
+
+from broadlink_ac_mqtt.ac_communication.broadlink.frame_codec import HEADER_SIZE, FrameCodec
+from tests.reference import legacy_encode_frame
+
+MAC = bytearray.fromhex('b4222dce73f1')
+
+
+def no_encrypt(payload):
+    return bytes(payload)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_encode_matches_the_legacy_builder(seed):
+    rng = random.Random(seed)
+    mac = bytearray(rng.randbytes(6))
+    codec = FrameCodec(mac)
+    for _ in range(200):
+        command = rng.choice((0x65, 0x6a))
+        count = rng.randrange(0x10000)
+        session_id = bytearray(rng.randbytes(4))
+        payload = bytearray(rng.randbytes(16 * rng.randrange(0, 6)))
+        assert codec.encode(command, count, session_id, payload, no_encrypt) == \
+            legacy_encode_frame(mac, command, count, session_id, payload, no_encrypt)
+
+
+def test_header_fields():
+    codec = FrameCodec(MAC)
+    payload = os.urandom(32)
+    frame = codec.encode(0x6a, 0x1234, b'\x01\x02\x03\x04', payload, no_encrypt)
+    assert frame[0x24:0x26] == b'\x2a\x4e'
+    assert frame[0x26] == 0x6a
+    assert FrameCodec.count(frame) == 0x1234
+    assert frame[0x2a:0x30] == MAC
+    assert frame[0x30:0x34] == b'\x01\x02\x03\x04'
+    assert frame[0x34] | frame[0x35] << 8 == (0xbeaf + sum(payload)) & 0xffff
+    assert bytes(FrameCodec.payload(frame)) == payload
+    assert len(frame) == HEADER_SIZE + 32
+
+
+def test_checksum_is_over_the_encrypted_frame():
+    codec = FrameCodec(MAC)
+    frame = codec.encode(0x6a, 1, b'\0\0\0\0', bytes(16), lambda payload: b'\xff' * 16)
+    checksum = frame[0x20] | frame[0x21] << 8
+    frame[0x20:0x22] = b'\0\0'
+    assert checksum == (0xbeaf + sum(frame)) & 0xffff
+
+
+def test_error_code():
+    frame = bytearray(HEADER_SIZE)
+    frame[0x22:0x24] = b'\xf9\xff'
+    assert FrameCodec.error_code(frame) == 0xfff9
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from broadlink_ac_mqtt.ac_communication.broadlink import device_factory
+from broadlink_ac_mqtt.ac_communication.broadlink.state_codec import AC_STATE_CODEC
+from tests.reference import legacy_make_nice_status, random_values
+
+
+def make_device(values=None):
+    device = device_factory.create_device(dev_type=0x4E2a, host=('127.0.0.1', 80),
+                                          mac=bytearray.fromhex('b4430dce73f1'), name='test', connect=False)
+    for key, value in (values or {}).items():
+        device.status[key] = value
+    return device
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_the_legacy_implementation(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        device = make_device(random_values(rng))
+        nice = device.make_nice_status(device.status)
+        legacy = legacy_make_nice_status({key: device.status[key] for key in device.status})
+        assert nice == legacy
+        assert list(nice) == list(legacy)
+
+
+def test_cached_while_the_status_is_unchanged():
+    device = make_device(random_values(random.Random(0)))
+    nice = device.make_nice_status(device.status)
+    assert device.make_nice_status(device.status) is nice
+    # Bookkeeping fields don't count as a change
+    device.status['lastupdate'] = 1234
+    assert device.make_nice_status(device.status) is nice
+
+
+def test_changed_field_invalidates_the_cache():
+    device = make_device(random_values(random.Random(0)))
+    device.status['power'] = device.STATIC.ONOFF.ON
+    nice = device.make_nice_status(device.status)
+    device.status['power'] = device.STATIC.ONOFF.OFF
+    changed = device.make_nice_status(device.status)
+    assert changed is not nice
+    assert changed['power'] == 'OFF'
+    assert changed['mode_homeassistant'] == 'off'
+    assert nice['power'] == 'ON'
+
+
+def test_decoded_state_invalidates_the_cache_only_when_it_differs():
+    device = make_device()
+    values = random_values(random.Random(1))
+    state = tuple(values[name] for name in AC_STATE_CODEC.names)
+    device.status.update_decoded(AC_STATE_CODEC.names, state)
+    nice = device.make_nice_status(device.status)
+    device.status.update_decoded(AC_STATE_CODEC.names, state)
+    assert device.make_nice_status(device.status) is nice
+
+    other = tuple(values[name] if name != 'temp' else values['temp'] + 1 for name in AC_STATE_CODEC.names)
+    device.status.update_decoded(AC_STATE_CODEC.names, other)
+    assert device.make_nice_status(device.status)['temp'] == values['temp'] + 1
+
+
+def test_expected_status_leaves_the_status_and_cache_alone():
+    device = make_device(random_values(random.Random(2)))
+    nice = device.make_nice_status(device.status)
+    expected = device.expected_nice_status(device.temperature_changes(30))
+    assert expected['temp'] == 30
+    assert device.make_nice_status(device.status) is nice
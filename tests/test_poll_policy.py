@@ -0,0 +1,93 @@
+import types
+
+import pytest
+
+from broadlink_ac_mqtt.ac_to_mqtt_adapter import AcToMqtt
+from broadlink_ac_mqtt.poll_policy import PollPolicy
+
+ON = {'temp': 22.0, 'ambient_temp': 23, 'power': 'ON', 'mode': 'COOL'}
+OFF = dict(ON, power='OFF')
+
+
+def settle(policy, status, polls=20):
+    for _ in range(polls):
+        policy.observe(status)
+
+
+def test_idle_device_backs_off_to_the_slow_interval():
+    policy = PollPolicy(fast_interval=2, slow_interval=60, decay=1.5)
+    policy.on_activity()
+    intervals = []
+    for _ in range(10):
+        policy.observe(ON)
+        intervals.append(policy.interval)
+    assert intervals[:4] == pytest.approx([3, 4.5, 6.75, 10.125])
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == 60
+
+
+def test_change_on_the_remote_resets_to_the_fast_interval():
+    policy = PollPolicy(fast_interval=2, slow_interval=60)
+    settle(policy, ON)
+    policy.observe(dict(ON, temp=24.0))
+    assert policy.interval == 2
+
+
+def test_ambient_temperature_is_no_activity():
+    policy = PollPolicy(fast_interval=2, slow_interval=60)
+    settle(policy, ON)
+    policy.observe(dict(ON, ambient_temp=25))
+    assert policy.interval == 60
+
+
+def test_command_resets_to_the_fast_interval():
+    policy = PollPolicy(fast_interval=2, slow_interval=60)
+    settle(policy, ON)
+    policy.on_activity()
+    assert policy.interval == 2
+
+
+def test_powered_off_device_is_polled_slowly_once_settled():
+    policy = PollPolicy(fast_interval=2, slow_interval=60, off_interval=300)
+    settle(policy, ON)
+    policy.observe(OFF)
+    # Switching off is a change, it is followed closely first
+    assert policy.interval == 2
+    settle(policy, OFF)
+    assert policy.interval == 300
+
+    policy.observe(ON)
+    assert policy.interval == 2
+
+
+def test_from_config():
+    assert PollPolicy.from_config(None) is None
+    assert PollPolicy.from_config({}) is None
+
+    policy = PollPolicy.from_config({'fast_interval': 5, 'slow_interval': 20, 'unknown': 1})
+    assert (policy.fast_interval, policy.slow_interval, policy.off_interval) == (5, 20, 300)
+    # Intervals stay within the limits of the config
+    policy.on_activity()
+    assert policy.interval == 5
+    settle(policy, ON)
+    assert policy.interval == 20
+
+
+def make_adapter():
+    adapter = AcToMqtt({'update_interval': 10, 'info_interval': 60})
+    fast = types.SimpleNamespace(original_config={'poll': {'fast_interval': 0.1, 'slow_interval': 30}})
+    fixed = types.SimpleNamespace(original_config={'state_interval': 15})
+    adapter.device_objects = {'fast': fast, 'fixed': fixed}
+    return adapter, fast, fixed
+
+
+def test_each_device_polls_at_its_own_limits():
+    adapter, fast, fixed = make_adapter()
+    assert adapter.poll_interval('fast', fast) == 30
+    assert adapter.poll_interval('fixed', fixed) == 15
+    assert adapter.poll_policy('fixed', fixed) is None
+
+    # An applied command speeds up only its own device, and no faster than the bridge allows
+    adapter._on_changes_applied('fast', None)
+    assert adapter.poll_interval('fast', fast) == AcToMqtt.MIN_POLL_INTERVAL
+    assert adapter.poll_interval('fixed', fixed) == 15
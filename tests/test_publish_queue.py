@@ -0,0 +1,135 @@
+import collections
+
+import paho.mqtt.client as mqtt
+
+from broadlink_ac_mqtt.publish_queue import PublishQueue
+
+_Result = collections.namedtuple('_Result', 'rc mid')
+
+
+class Client:
+    """The part of paho's client the queue uses, publish answers with rc until told otherwise."""
+
+    def __init__(self):
+        self.connected = True
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+        self.published = []
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if self.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.published.append((topic, payload))
+        return _Result(self.rc, len(self.published))
+
+
+def acknowledge(queue, count=1):
+    for _ in range(count):
+        queue.on_publish(queue.client, None, 0)
+
+
+def test_latest_value_of_a_topic_wins():
+    client = Client()
+    client.connected = False
+    queue = PublishQueue(client)
+    queue.put('ac/temp', 20)
+    queue.put('ac/mode', 'cool')
+    queue.put('ac/temp', 21)
+    assert len(queue) == 2
+
+    client.connected = True
+    queue.flush()
+    assert client.published == [('ac/temp', 21), ('ac/mode', 'cool')]
+
+
+def test_inflight_is_capped_and_released_on_publish():
+    client = Client()
+    queue = PublishQueue(client, max_inflight=2)
+    for index in range(5):
+        queue.put(f'ac/{index}', index)
+    assert [topic for topic, _ in client.published] == ['ac/0', 'ac/1']
+    assert queue.inflight == 2
+    assert len(queue) == 3
+
+    acknowledge(queue)
+    assert [topic for topic, _ in client.published] == ['ac/0', 'ac/1', 'ac/2']
+    acknowledge(queue, 4)
+    assert len(client.published) == 5
+    assert queue.inflight == 0
+    assert len(queue) == 0
+
+
+def test_oldest_topic_is_dropped_when_full():
+    client = Client()
+    client.connected = False
+    queue = PublishQueue(client, max_pending=2)
+    for index in range(3):
+        queue.put(f'ac/{index}', index)
+    client.connected = True
+    queue.flush()
+    assert client.published == [('ac/1', 1), ('ac/2', 2)]
+
+
+def test_messages_without_a_connection_are_requeued():
+    client = Client()
+    queue = PublishQueue(client)
+    client.rc = mqtt.MQTT_ERR_NO_CONN
+    queue.put('ac/temp', 20, flush=False)
+    queue.put('ac/mode', 'cool')
+    assert client.published == []
+    assert queue.inflight == 0
+    assert len(queue) == 2
+
+    # A newer value queued meanwhile replaces the requeued one
+    client.rc = mqtt.MQTT_ERR_SUCCESS
+    client.connected = False
+    queue.put('ac/temp', 21)
+    client.connected = True
+    queue.on_connect(client, None, {}, 0)
+    assert client.published == [('ac/temp', 21), ('ac/mode', 'cool')]
+
+
+def test_other_errors_drop_the_message():
+    client = Client()
+    queue = PublishQueue(client)
+    client.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+    queue.put('ac/temp', 20)
+    assert queue.inflight == 0
+    assert len(queue) == 0
+
+
+def test_reconnect_flushes_and_forgets_the_inflight_messages():
+    client = Client()
+    queue = PublishQueue(client, max_inflight=2)
+    for index in range(4):
+        queue.put(f'ac/{index}', index)
+    # The acknowledgements of the old connection never come
+    client.connected = False
+    queue.put('ac/4', 4)
+    assert len(client.published) == 2
+
+    client.connected = True
+    queue.on_connect(client, None, {}, 0)
+    assert [topic for topic, _ in client.published] == ['ac/0', 'ac/1', 'ac/2', 'ac/3']
+    assert queue.inflight == 2
+    # A refused connection doesn't publish
+    queue.on_connect(client, None, {}, 5)
+    assert len(client.published) == 4
+
+
+def test_without_on_publish_the_queue_stalls_at_the_cap():
+    client = Client()
+    queue = PublishQueue(client, max_inflight=3)
+    for value in range(3):
+        for index in range(10):
+            queue.put(f'ac/{index}', value)
+    # Nothing releases the first messages, every later value waits for good
+    assert client.published == [('ac/0', 0), ('ac/1', 0), ('ac/2', 0)]
+    assert queue.inflight == 3
+    assert len(queue) == 10
+    assert dict(queue._pending)['ac/9'] == (2, False, 0)
+
+    # Only a new connection resets the count
+    queue.on_connect(client, None, {}, 0)
+    assert len(client.published) == 6
@@ -0,0 +1,82 @@
+from broadlink_ac_mqtt.scheduler import DeadlineScheduler, VirtualClock
+
+
+def make_scheduler(**kwargs):
+    clock = VirtualClock()
+    return clock, DeadlineScheduler(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_wait_sleeps_until_the_earliest_deadline():
+    clock, scheduler = make_scheduler()
+    scheduler.schedule('a', 10)
+    scheduler.schedule('b', 3)
+    scheduler.wait()
+    assert clock() == 3
+    assert scheduler.pop_due() == ['b']
+    scheduler.wait()
+    assert clock() == 10
+    assert scheduler.pop_due() == ['a']
+
+
+def test_wait_is_bounded_by_timeout():
+    clock, scheduler = make_scheduler()
+    scheduler.schedule('a', 10)
+    scheduler.wait(timeout=4)
+    assert clock() == 4
+    assert scheduler.pop_due() == []
+
+
+def test_reschedule_replaces_the_earlier_deadline():
+    clock, scheduler = make_scheduler()
+    scheduler.schedule('a', 2)
+    scheduler.schedule('a', 5)
+    scheduler.wait()
+    assert clock() == 5
+    assert scheduler.pop_due() == ['a']
+    assert scheduler.next_due() is None
+
+
+def test_cancel():
+    clock, scheduler = make_scheduler()
+    scheduler.schedule('a', 1)
+    scheduler.cancel('a')
+    assert 'a' not in scheduler
+    assert scheduler.next_due() is None
+
+
+def test_pop_due_returns_earliest_first():
+    clock, scheduler = make_scheduler()
+    for key, delay in (('c', 3), ('a', 1), ('b', 2)):
+        scheduler.schedule(key, delay)
+    clock.sleep(5)
+    assert scheduler.pop_due() == ['a', 'b', 'c']
+
+
+def test_schedule_spread_stays_within_the_interval():
+    clock, scheduler = make_scheduler()
+    for key in range(100):
+        scheduler.schedule_spread(key, 10)
+    due = []
+    while len(due) < 100 and clock() <= 10:
+        scheduler.wait()
+        due += [(clock(), key) for key in scheduler.pop_due()]
+    assert sorted(key for _, key in due) == list(range(100))
+    # Spread out instead of all at once
+    assert len({at for at, _ in due}) > 1
+
+
+def test_periods_do_not_drift_over_an_hour():
+    # Counted from the start of a poll, a poll taking its time doesn't push the next one back
+    clock, scheduler = make_scheduler()
+    scheduler.schedule('a', 0)
+    polls = []
+    while clock() < 3600:
+        started = clock()
+        for key in scheduler.pop_due():
+            polls.append(started)
+            clock.sleep(0.15)
+            scheduler.schedule_at(key, started + 7)
+        scheduler.wait()
+    assert all(b - a == 7 for a, b in zip(polls, polls[1:]))
+    # Only woken up when a poll is due
+    assert clock.sleeps <= 2 * len(polls)
@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from broadlink_ac_mqtt.ac_communication.broadlink.state_codec import AC_STATE_CODEC
+from tests.reference import legacy_decode_state, random_state
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_round_trip(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        state = random_state(rng)
+        decoded = dict(zip(AC_STATE_CODEC.names, AC_STATE_CODEC.decode(AC_STATE_CODEC.encode(state))))
+        assert {name: decoded[name] for name in AC_STATE_CODEC.writable_names} == \
+               {name: state[name] for name in AC_STATE_CODEC.writable_names}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_decodes_like_the_hand_written_shifts(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        block = bytes(rng.randrange(256) for _ in range(AC_STATE_CODEC.size))
+        expected = {}
+        legacy_decode_state(block, expected)
+        decoded = {}
+        AC_STATE_CODEC.decode_into(block, decoded)
+        assert decoded == expected
+        assert AC_STATE_CODEC.decode(block) == tuple(expected[name] for name in AC_STATE_CODEC.names)
+
+
+def test_fraction_of_a_degree_is_sent_as_half():
+    state = random_state(random.Random(0))
+    state['temp'] = 22.2
+    block = AC_STATE_CODEC.encode(state)
+    assert dict(zip(AC_STATE_CODEC.names, AC_STATE_CODEC.decode(block)))['temp'] == 22.5
+
+
+def test_ifeel_is_never_written():
+    state = random_state(random.Random(0))
+    state['ifeel'] = 1
+    block = AC_STATE_CODEC.encode(state)
+    assert block[15] >> 3 & 1 == 0